@@ -1,14 +1,14 @@
 import os 
 
+import asyncio
 import socketio
-import secrets
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import base64
 import numpy as np
-from io import BytesIO
-from PIL import Image
+import sys
 import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 # from test import get_eigenFace_mse
 
@@ -18,9 +18,22 @@ from typing import Literal
 
 import numpy as np
 import cv2
-from keras_core.models import Sequential
-from keras_core.layers import Dense, Dropout, Flatten
-from keras_core.layers import Conv2D, MaxPooling2D
+
+from newBackend.adaptive_sampler import AdaptiveSampler, SamplerStats
+from newBackend.batching import InferenceBatcher
+from newBackend.client_expressions import laugh_score
+from newBackend.frame_decode import scale_boxes
+from newBackend.frame_gate import FaceChange, FrameGate, GateStats
+from newBackend.frame_slot import LatestFrameSlot, SlotStats
+from newBackend.frame_ring import FrameRing
+from newBackend.face_tracker import FaceTracker
+from newBackend.inference_pool import InferencePool, crop_face, detect_faces, load_detector, warm_up_worker
+from newBackend.keyframe import KeyframeStats, frame_bytes, select_keyframe, split_jpegs
+from newBackend.laugh_scoring import LaughScorer
+from newBackend.load_control import LoadController
+from newBackend.lobby_shards import lobby_shard, new_lobby_code
+from newBackend.model_registry import get_model, warm_up
+from newBackend.result_cache import CacheStats, PredictionCache, predict_with_cache
 
 # import matplotlib.pyplot as plt
 # Suppress unnecessary logs
@@ -39,25 +52,10 @@ class Colors:
 # a = ap.parse_args()
 # mode = a.mode
 
-# Create the model
-model = Sequential()
-
-# Add layers
-model.add(Conv2D(32, kernel_size=(3, 3), activation='relu', input_shape=(48, 48, 1)))
-model.add(Conv2D(64, kernel_size=(3, 3), activation='relu'))
-model.add(MaxPooling2D(pool_size=(2, 2)))
-model.add(Dropout(0.25))
-
-model.add(Conv2D(128, kernel_size=(3, 3), activation='relu'))
-model.add(MaxPooling2D(pool_size=(2, 2)))
-model.add(Conv2D(128, kernel_size=(3, 3), activation='relu'))
-model.add(MaxPooling2D(pool_size=(2, 2)))
-model.add(Dropout(0.25))
-
-model.add(Flatten())
-model.add(Dense(1024, activation='relu'))
-model.add(Dropout(0.5))
-model.add(Dense(7, activation='softmax'))
+# Emotion model backend: keras, numpy or tflite (see newBackend/model_registry.py).
+# The model is loaded on first use, or by the warm-up when the server starts
+emotion_backend = os.environ.get('KRACKLE_EMOTION_BACKEND', 'keras')
+warm_up_model = os.environ.get('KRACKLE_WARM_UP', '1') == '1'
 
 # Disable OpenCL to avoid unnecessary logs
 cv2.ocl.setUseOpenCL(False)
@@ -69,36 +67,206 @@ emotion_history: list[float] = []
 # Frame rate for webcam
 frame_rate: int | float = 5
 
-# Load pre-trained weights
-model.load_weights('newBackend/model.h5')
+# Runs one forward pass over face crops queued by every connection
+def predict_batch(crops: list[np.ndarray]) -> np.ndarray:
+    """
+    Predicts the emotion probabilities for a batch of face crops.
+
+    :param crops: A list of (48, 48, 1) grayscale face crops.
+    :type crops: list[np.ndarray]
+    :return: An (N, 7) array of probabilities, one row per crop.
+    :rtype: np.ndarray
+    """
+    return get_model(emotion_backend).predict(np.stack(crops), verbose=0)
+
+# Short side (in pixels) incoming frames are decoded down to, before face detection
+decode_min_side = int(os.environ.get('KRACKLE_DECODE_MIN_SIDE', 240))
+
+# Frames a player's face is tracked for before the face detector runs again, and the
+# lowest template match score still accepted as the same face
+redetect_every = int(os.environ.get('KRACKLE_REDETECT_EVERY', 10))
+track_min_confidence = float(os.environ.get('KRACKLE_TRACK_MIN_CONFIDENCE', 0.6))
+
+# Draw face boxes and emotions onto frames passed to predict_emotion (the server never shows them)
+debug_annotations = os.environ.get('KRACKLE_DEBUG_ANNOTATE', '0') == '1'
+
+# Per-player cache of predictions by perceptual hash of the crop: entries kept (0 turns it off),
+# and how many of the 64 hash bits two crops may differ in to share a prediction
+result_cache_size = int(os.environ.get('KRACKLE_RESULT_CACHE_SIZE', 16))
+result_cache_distance = int(os.environ.get('KRACKLE_RESULT_CACHE_DISTANCE', 4))
+result_cache_stats = CacheStats()
+
+# Frames whose face (the lower half of the tracked box) differs from the last analysed one by less than
+# this mean absolute difference (gray levels, 0 turns it off) reuse its result, for at most max_reuse
+# frames in a row: at 5 fps a static face is still analysed every second, and scored 4 times per laugh
+# window (see newBackend/frame_gate.py for the measurements behind the threshold)
+frame_change_threshold = float(os.environ.get('KRACKLE_FRAME_CHANGE_THRESHOLD', 2.0))
+frame_max_reuse = int(os.environ.get('KRACKLE_FRAME_MAX_REUSE', 4))
+frame_gate_stats = GateStats()
+
+# A player's last result is reused for up to this long while Happy + Surprised is far from the laugh
+# threshold and steady (0 analyses every frame), unless the lower face differs from the last analysed
+# frame by sample_wake_change gray levels, see newBackend/adaptive_sampler.py and newBackend/frame_gate.py
+sample_max_interval_ms = float(os.environ.get('KRACKLE_SAMPLE_MAX_INTERVAL_MS', 1000))
+sample_wake_change = float(os.environ.get('KRACKLE_SAMPLE_WAKE_CHANGE', 4.0))
+sampler_stats = SamplerStats()
+
+# A frame laughs when Happy + Surprised is over laugh_threshold, and a player loses the round when more
+# than laugh_ratio of their frames of the last laugh_window_s seconds laughed, see newBackend/laugh_scoring.py
+laugh_window_s = float(os.environ.get('KRACKLE_LAUGH_WINDOW_S', 4.0))
+laugh_threshold = float(os.environ.get('KRACKLE_LAUGH_THRESHOLD', 0.8))
+laugh_ratio = float(os.environ.get('KRACKLE_LAUGH_RATIO', 0.3))
+
+# Bursts of frames (a 'frames' list, or JPEGs back to back in 'bytes') only run their sharpest frame
+keyframe_stats = KeyframeStats()
+
+# Each connection has one frame waiting at most, a newer frame replaces it. Frames sent with a
+# capturedAt time (ms since the epoch) that are this much later than usual are skipped, 0 keeps them all
+frame_deadline_ms = float(os.environ.get('KRACKLE_FRAME_DEADLINE_MS', 1000))
+frame_slot_stats = SlotStats()
+
+# Face detector backend: haar, yunet or ssd (see newBackend/face_detection.py)
+face_detector = os.environ.get('KRACKLE_FACE_DETECTOR', 'haar')
+
+# Worker processes for detection and inference, 0 keeps everything in this process
+inference_workers = int(os.environ.get('KRACKLE_INFERENCE_WORKERS', os.cpu_count() or 1))
+# Frames and crops reach the workers through shared memory, 0 slots pickles them instead
+frame_ring_slots = int(os.environ.get('KRACKLE_FRAME_RING_SLOTS', 32))
+# Created by start_inference in the serving process: serve.py imports this module before it forks,
+# and every worker needs a pool and a ring of its own
+inference_pool: InferencePool | None = None
+# Without a pool detection runs in one thread of its own, the DNN detectors must not run concurrently
+detection_executor: ThreadPoolExecutor | None = None
+if inference_workers <= 0:
+    load_detector(face_detector)
+    detection_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='detection')
+
+def create_inference_pool() -> InferencePool:
+    return InferencePool(
+        workers=inference_workers,
+        max_in_flight=int(os.environ.get('KRACKLE_MAX_IN_FLIGHT', 2 * inference_workers)),
+        ring=FrameRing(slots=frame_ring_slots) if frame_ring_slots > 0 else None,
+        detector=face_detector,
+        model_backend=emotion_backend,
+    )
+
+async def predict_batch_anywhere(crops: list) -> list:
+    # In the process pool once it is started, in a thread of this process without one
+    if inference_pool:
+        return await inference_pool.predict_batch(crops)
+    return list(await asyncio.get_running_loop().run_in_executor(None, predict_batch, crops))
+
+# Shared micro-batching queue, e.g. 32 crops or 10 ms, whichever comes first
+inference_batcher = InferenceBatcher(
+    predict_batch_anywhere,
+    max_batch_size=int(os.environ.get('KRACKLE_BATCH_SIZE', 32)),
+    max_wait=float(os.environ.get('KRACKLE_BATCH_WAIT_MS', 10)) / 1000,
+    max_concurrent_batches=max(inference_workers, 1),
+)
+
+# Recommended time between a client's frames, sent to it in 'capture_control' events: it grows while
+# frames take longer than the target latency from their arrival (the node's frames for everyone, the
+# player's own frames for that player) or too many crops wait for inference, and past twice the base
+# interval clients also send smaller frames (see newBackend/load_control.py)
+load_controller = LoadController(
+    lambda: inference_batcher.pending,
+    base_interval=float(os.environ.get('KRACKLE_CAPTURE_INTERVAL_MS', 500)) / 1000,
+    max_interval=float(os.environ.get('KRACKLE_CAPTURE_MAX_INTERVAL_MS', 3000)) / 1000,
+    target_latency=float(os.environ.get('KRACKLE_TARGET_LATENCY_MS', 250)) / 1000,
+    max_queue=int(os.environ.get('KRACKLE_MAX_QUEUE', 64)),
+)
+
+async def predict_crops(crops: list, items: list | None = None, cache: PredictionCache | None = None) -> list:
+    # Predict emotion for every face of the frame the player's cache has no close match for,
+    # in one forward pass batched together with the crops of the other connections
+    return await predict_with_cache(cache, crops, inference_batcher.submit_many, items)
+
+# Frames being worked on in a slot of the frame ring, referenced so they aren't garbage collected
+ring_jobs: set[asyncio.Task] = set()
+
+async def predict_in_ring(gray: np.ndarray, tracked_faces: list, tracked_crops: list, hint,
+                          cache: PredictionCache | None) -> tuple[list, list]:
+    # The worker processes write crops and probabilities into the slot, so it is only handed back
+    # once their jobs are done, never while one of them still writes into it
+    async with inference_pool.ring.slot() as slot:
+        if tracked_faces:
+            faces, refs = tracked_faces, inference_pool.write_crops(slot, tracked_crops)
+        else:
+            faces, refs = await inference_pool.detect_faces_in_slot(slot, gray, hint)
+        crops = [inference_pool.ring.crops[ref] for ref in refs]
+        return faces, await predict_crops(crops, refs, cache)
+
+async def detect_and_predict(frame: np.ndarray, scale: float = 1.0, tracker: FaceTracker | None = None,
+                             cache: PredictionCache | None = None) -> tuple[list, list]:
+    """
+    Finds the faces in a frame and predicts the emotion of each of them.
+
+    :param frame: The input frame, BGR or (reduced) grayscale.
+    :type frame: np.ndarray
+    :param scale: Factor mapping ``frame`` coordinates to full-resolution coordinates, see decode_gray.
+    :type scale: float
+    :param tracker: The player's face tracker. While it follows the face only that face
+        is returned, and the face detector runs just when the tracker asks for it.
+    :type tracker: FaceTracker | None
+    :return: The full-resolution (x, y, w, h) box of every face (largest first when
+        tracking), and its predictions.
+    :rtype: tuple[list, list]
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    tracked = tracker.track(gray) if tracker else None
+    tracked_faces = [tracked] if tracked else []
+    tracked_crops = [crop_face(gray, tracked)] if tracked else []
+    # When the detector has to run, search around (and at the size of) the last known face
+    hint = tracker.box if tracker and not tracked else None
+
+    # Haar detection is the slow part, keep it off the event loop when there is a pool
+    if inference_pool and inference_pool.ring:
+        # Shielded: a cancelled frame (e.g. the player disconnected) stops waiting for the job,
+        # but the job keeps its slot until the workers are done with it
+        job = asyncio.get_running_loop().create_task(
+            predict_in_ring(gray, tracked_faces, tracked_crops, hint, cache))
+        ring_jobs.add(job)
+        job.add_done_callback(ring_jobs.discard)
+        faces, preds = await asyncio.shield(job)
+    else:
+        if tracked:
+            faces, crops = tracked_faces, tracked_crops
+        elif inference_pool:
+            faces, crops = await inference_pool.run(detect_faces, gray, hint)
+        else:
+            # Without a pool (serve.py's default with several workers) off the event loop all the same
+            faces, crops = await asyncio.get_running_loop().run_in_executor(detection_executor, detect_faces,
+                                                                            gray, hint)
+        preds = await predict_crops(crops, cache=cache)
+
+    if tracker and not tracked:
+        # Follow the largest face, and report it first like the tracked frames do
+        order = sorted(range(len(faces)), key=lambda i: faces[i][2] * faces[i][3], reverse=True)
+        faces, preds = [faces[i] for i in order], [preds[i] for i in order]
+        tracker.reset(gray, faces[0] if faces else None)
+
+    return scale_boxes(faces, scale), preds
 
 # Function to predict emotion
-def predict_emotion(frame: np.ndarray) -> list:
+async def predict_emotion(frame: np.ndarray, annotate: bool = debug_annotations) -> list:
     """
     Predicts the emotion from a given frame.
 
     :param frame: The input frame from the webcam.
     :type frame: np.ndarray
+    :param annotate: Draw each face's box and emotion onto ``frame``, only useful when debugging.
+    :type annotate: bool
     :return: A list of predictions for each detected face in the frame.
     :rtype: list
     """
-    facecasc = cv2.CascadeClassifier('newBackend/haarcascade_frontalface_default.xml')
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    faces = facecasc.detectMultiScale(gray, scaleFactor=1.3, minNeighbors=5)
-    preds = []
+    faces, preds = await detect_and_predict(frame)
+    if not annotate:
+        return preds
 
-    for (x, y, w, h) in faces:
+    for (x, y, w, h), prediction in zip(faces, preds):
         # Draw a rectangle around the face
         cv2.rectangle(frame, (x, y-50), (x+w, y+h+10), (255, 0, 0), 2)
 
-        # Process the region of interest
-        roi_gray = gray[y:y + h, x:x + w]
-        cropped_img = np.expand_dims(np.expand_dims(cv2.resize(roi_gray, (48, 48)), -1), 0)
-
-        # Predict emotion
-        prediction = model.predict(cropped_img, verbose=0)
-        preds.append(prediction[0])
-
         # Get emotion with max probability
         maxindex = int(np.argmax(prediction))
         cv2.putText(frame, emotion_dict[maxindex], (x+20, y-60), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2, cv2.LINE_AA)
@@ -106,7 +274,7 @@ def predict_emotion(frame: np.ndarray) -> list:
     return preds
 
 def predict_from_face(face: np.ndarray) -> Literal["Angry", "Disgusted", "Fearful", "Happy", "Neutral", "Sad", "Surprised"]:
-    prediction = model.predict(face, verbose=0)
+    prediction = get_model(emotion_backend).predict(face, verbose=0)
     maxindex = int(np.argmax(prediction))
     return emotion_dict[maxindex]
 
@@ -130,11 +298,82 @@ app.add_middleware(
 # In-memory storage for lobbies
 lobbies = {}
 
+# Set by serve.py in lobby-sharded mode: this process owns the lobbies whose code hashes to
+# shard_index out of shard_count, and Socket.IO connections carrying a lobbyCode are routed to it
+shard_index = 0
+shard_count = 1
+
+# Indexes of the lobbies by connection: sid -> lobby code, and sid -> the player's record in
+# lobby['players']. Kept in sync by createGame, joinLobby and leave_lobby, so handlers never scan lobbies
+lobby_by_sid: dict[str, str] = {}
+player_by_sid: dict[str, dict] = {}
+
+# Per-connection frame pipeline state (face tracker, ...), keyed by sid.
+# Kept out of the player records, those are emitted to clients as-is
+frame_state = {}
+
+# Frames whose processing raised, their players got no result
+frame_errors = 0
+
+# The background model warm-up, referenced so it isn't collected before it is done
+warm_up_task: asyncio.Task | None = None
+
+async def warm_up_workers():
+    loop = asyncio.get_running_loop()
+    if inference_pool:
+        # Workers load the model when they start, one job each gets them all started
+        jobs = [inference_pool.run(warm_up_worker) for _ in range(inference_pool.workers)]
+    else:
+        jobs = [loop.run_in_executor(None, warm_up, emotion_backend)]
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        print(f"[inference] Warm-up failed in {len(failures)} of {len(jobs)} workers: {failures[0]!r}",
+              file=sys.stderr)
+
+@app.on_event("startup")
+async def start_inference():
+    global inference_pool, warm_up_task
+    if inference_workers > 0 and inference_pool is None:
+        inference_pool = create_inference_pool()
+    if not warm_up_model:
+        return
+    # In the background, so the server accepts connections while the weights load
+    warm_up_task = asyncio.get_running_loop().create_task(warm_up_workers())
+
+@app.on_event("shutdown")
+async def shutdown_inference_pool():
+    global inference_pool
+    if inference_pool:
+        inference_pool.shutdown()
+        inference_pool = None
+
 # Root route for checking the server
 @app.get("/")
 async def root():
     return {"message": "Socket.IO Backend is running."}
 
+# Inference counters of this server process
+@app.get("/stats")
+async def stats():
+    return {
+        "load": load_controller.as_dict(),
+        "frame_slot": frame_slot_stats.as_dict(),
+        "frame_gate": frame_gate_stats.as_dict(),
+        "sampler": sampler_stats.as_dict(),
+        "keyframe": keyframe_stats.as_dict(),
+        "result_cache": result_cache_stats.as_dict(),
+        "batcher": {
+            "batches": inference_batcher.batches_run,
+            "mean_batch_size": round(inference_batcher.mean_batch_size, 2),
+        },
+        "inference": {
+            "workers": inference_pool.workers if inference_pool else 0,
+            "pool_restarts": inference_pool.restarts if inference_pool else 0,
+            "frame_errors": frame_errors,
+        },
+    }
+
 # Socket.IO Event Handling
 @sio.event
 async def connect(sid, environ):
@@ -143,9 +382,12 @@ async def connect(sid, environ):
 @sio.event
 async def createGame(sid, gameData):
     print(f'Create Game Event Received: {gameData}')
-    
-    # Generate a unique game ID
-    gameId = secrets.token_hex(4)
+
+    # A connection is in one lobby at a time
+    await leave_lobby(sid)
+
+    # Generate a unique game ID, owned by this process
+    gameId = new_lobby_code(shard_index, shard_count, lobbies)
     
     # Create a new lobby
     lobbies[gameId] = {
@@ -157,11 +399,15 @@ async def createGame(sid, gameData):
             'maxPlayers': gameData['players']
         },
         'players': [],
-        'round_start_time': None
+        'round_start_time': None,
+        'scorer': LaughScorer(window=laugh_window_s, threshold=laugh_threshold, ratio=laugh_ratio)
     }
     lobby = lobbies[gameId]
-    player = {'id': sid, 'name': gameData['adminName'], 'emotion_history': [(0, 0)]}
+    player = {'id': sid, 'name': gameData['adminName']}
     lobby['players'].append(player)
+    lobby['scorer'].add_player(sid)
+    lobby_by_sid[sid] = gameId
+    player_by_sid[sid] = player
     # Admin joins the lobby room
     await sio.enter_room(sid, gameId)
 
@@ -183,8 +429,16 @@ async def joinLobby(sid, data):
     if lobby:
         if len(lobby['players']) < lobby['settings']['maxPlayers']:
             if not lobby['round_start_time']:
-                player = {'id': sid, 'name': playerName, 'emotion_history': [(0, 0)]}
+                if lobby_by_sid.get(sid) == lobbyCode:
+                    # Joining again replaces the player's record
+                    lobby['players'].remove(player_by_sid[sid])
+                else:
+                    await leave_lobby(sid)
+                player = {'id': sid, 'name': playerName}
                 lobby['players'].append(player)
+                lobby['scorer'].add_player(sid)
+                lobby_by_sid[sid] = lobbyCode
+                player_by_sid[sid] = player
 
                 players_names = [player['name'] for player in lobby['players']]
                 await sio.enter_room(sid, lobbyCode)
@@ -204,7 +458,11 @@ async def joinLobby(sid, data):
     
     else:
         # Lobby not found
-        await sio.emit('joinLobbyResponse', {'success': False, 'message': 'Lobby not found.'}, to=sid)
+        response = {'success': False, 'message': 'Lobby not found.'}
+        if shard_count > 1 and lobby_shard(lobbyCode, shard_count) != shard_index:
+            # Another process owns this lobby, the client has to connect again with ?lobbyCode=... to reach it
+            response['reconnect'] = {'lobbyCode': lobbyCode}
+        await sio.emit('joinLobbyResponse', response, to=sid)
 
 @sio.event
 async def startGame(sid, lobbyCode):
@@ -213,6 +471,7 @@ async def startGame(sid, lobbyCode):
     if lobby and lobby['admin'] == sid:
         # Emit 'gameStarted' to all players in the lobby
         lobby['round_start_time'] = time.time()
+        lobby['scorer'].reset()
         players_names = [player['name'] for player in lobby['players']]
         await sio.emit('gameStarted', {'gameSettings': lobby['settings'], 'room': lobbyCode, 'players': players_names}, to=lobbyCode)
     else:
@@ -223,61 +482,143 @@ async def startGame(sid, lobbyCode):
 async def disconnect(sid):
     print(f"User disconnected: {sid}")
 
-    # Remove player from any lobbies they were part of
-    for gameId, lobby in lobbies.items():
-        playerIndex = next((i for i, p in enumerate(lobby['players']) if p['id'] == sid), None)
-        if playerIndex is not None:
-            removedPlayer = lobby['players'].pop(playerIndex)
-            await sio.emit('playerLeft', removedPlayer, room=gameId)
-
-        # If the disconnected user was the admin, handle lobby closure
-        if lobby['admin'] == sid:
-            del lobbies[gameId]
-            await sio.emit('lobbyClosed', {'message': 'Lobby has been closed by the admin.'}, room=gameId)
+    state = frame_state.pop(sid, None)
+    if state:
+        state['slot'].close()
+    load_controller.remove_player(sid)
+
+    await leave_lobby(sid)
+
+
+async def leave_lobby(sid):
+    # Remove the player from their lobby, and close the lobby if they were its admin
+    gameId = lobby_by_sid.pop(sid, None)
+    removedPlayer = player_by_sid.pop(sid, None)
+    lobby = lobbies.get(gameId)
+    if lobby is None:
+        return
+
+    if removedPlayer is not None:
+        lobby['players'].remove(removedPlayer)
+        lobby['scorer'].remove_player(sid)
+        await sio.emit('playerLeft', removedPlayer, room=gameId)
+
+    # If the player was the admin, handle lobby closure
+    if lobby['admin'] == sid:
+        del lobbies[gameId]
+        for player in lobby['players']:
+            lobby_by_sid.pop(player['id'], None)
+            player_by_sid.pop(player['id'], None)
+        await sio.emit('lobbyClosed', {'message': 'Lobby has been closed by the admin.'}, room=gameId)
+
+
+def player_state(sid) -> dict:
+    # The frame pipeline state of a connection, created with its first frame
+    if sid not in frame_state:
+        state = frame_state[sid] = {
+            'tracker': FaceTracker(redetect_every=redetect_every, min_confidence=track_min_confidence),
+            'cache': PredictionCache(result_cache_size, result_cache_distance, result_cache_stats)
+            if result_cache_size > 0 else None,
+            'face_change': FaceChange(),
+            'gate': FrameGate(frame_change_threshold, frame_max_reuse, frame_gate_stats)
+            if frame_change_threshold > 0 else None,
+            'sampler': AdaptiveSampler(laugh_threshold, max_interval=sample_max_interval_ms / 1000,
+                                       wake_change=sample_wake_change, stats=sampler_stats)
+            if sample_max_interval_ms > 0 else None,
+        }
+        state['slot'] = LatestFrameSlot(lambda frame: process_webcam_frame(sid, state, *frame),
+                                        max_age=frame_deadline_ms / 1000 if frame_deadline_ms > 0 else None,
+                                        stats=frame_slot_stats)
+    return frame_state[sid]
 
 
 # WebSocket route to handle webcam data and send back processing results
 @sio.event
 async def webcam_data(sid, data):
-    # Process the webcam data (base64 image)
-    print(data)
-    lobby_code = data['lobbyCode']
-    lobby = lobbies.get(lobby_code)
-
-    base64_data = data['image'].split(",")[1]
-    # Decode the base64 image
-    image_data = base64.b64decode(base64_data)
-    player_number = 0
-    for i, player in enumerate(lobby['players']):
-        if player['id'] == sid:
-            player_number = i
-    message = None
+    # Only the newest frame waits for processing, a frame still waiting when the next one arrives is dropped.
+    # The arrival time goes along, so the load controller sees the time frames wait for their turn
+    if not isinstance(data, dict):
+        data = {}
+    player_state(sid)['slot'].offer((data, time.perf_counter()), data.get('capturedAt'))
+
+
+async def send_capture_control(sid, state: dict):
+    # Tell the client its recommended frame interval and size, whenever that changes
+    control = load_controller.control(sid)
+    if control != state.get('control'):
+        state['control'] = control
+        await sio.emit('capture_control', control, to=sid)
+
+
+async def process_webcam_frame(sid, state: dict, data: dict, arrived: float):
+    global frame_errors
+    # Process the webcam data: raw JPEG bytes (binary attachment, one JPEG or a burst of them back
+    # to back), a base64 data URL, or a burst as a 'frames' list of either
+    lobby = lobbies.get(lobby_by_sid.get(sid))
+    player = player_by_sid.get(sid)
+    if lobby is None or player is None:
+        return
+    if lobby['round_start_time'] is None:
+        # Frames before the round starts are not scored
+        await sio.emit('webcam_response', {'message': None, 'capturedAt': data.get('capturedAt')}, to=sid)
+        return
 
+    message = None
     try:
-        lobby['players'][player_number]['emotion_history'] = [
-            entry for entry in lobby['players'][player_number]['emotion_history']
-            if (time.time() - lobby['round_start_time'] - entry[0]) <= 4
-        ]
-        
-        image = Image.open(BytesIO(image_data))
-        # Convert to OpenCV format
-        image_np = np.array(image)
-
-        emotions = predict_emotion(image_np)
-
-        if emotions != []:
-            pred = 0 
-            if emotions[0][3] + emotions[0][6] > 0.8:
-                pred = 1
-            history_append = (time.time() - lobby['round_start_time'], pred)
-            lobby['players'][player_number]['emotion_history'].append(history_append)
-            if sum(item[1] for item in lobby['players'][player_number]['emotion_history']) / len(lobby['players'][player_number]['emotion_history']) > 0.3:
-                message = 'roundLost'
+        # A malformed payload counts as a failed frame and still gets its response
+        frames = data.get('frames')
+        if frames:
+            frames = [frame_bytes(frame) for frame in frames]
+        elif data.get('bytes') is not None:
+            frames = split_jpegs(data['bytes'])
+        else:
+            frames = [frame_bytes(data['image'])]
+
+        # Decode straight to a reduced grayscale frame, the model only needs 48x48 crops.
+        # Of a burst only the sharpest frame is kept, scored around the tracked face
+        _, gray, scale = select_keyframe(frames, min_side=decode_min_side, box=state['tracker'].box,
+                                         stats=keyframe_stats)
+
+        gate, sampler, tracker = state['gate'], state['sampler'], state['tracker']
+        analysed = 'emotions' in state
+        # How much the face changed since the last analysed frame, both skips decide on it
+        change = state['face_change'].measure(gray, tracker.box)
+        if analysed and gate and gate.unchanged(change):
+            # The face looks as it did in the last analysed frame, its result still holds
+            fresh = False
+        elif analysed and sampler and not sampler.due(change):
+            # Far from laughing and steady, no need to look again yet
+            fresh = False
+        else:
+            _, emotions = await detect_and_predict(gray, scale, tracker=tracker, cache=state['cache'])
+            state['emotions'] = emotions
+            fresh = True
+            state['face_change'].accept(gray, tracker.box)
+            if gate:
+                gate.accept()
+            if sampler and emotions != []:
+                sampler.update(laugh_score(emotions[0]))
+            elif sampler:
+                sampler.reset()
+
+        # Only fresh results go into the laugh window, a reused one is no new evidence
+        emotions = state['emotions']
+        if fresh and emotions != []:
+            lost = lobby['scorer'].update(sid, laugh_score(emotions[0]))
+        else:
+            lost = lobby['scorer'].lost(sid)
+        if lost:
+            message = 'roundLost'
         
-    except:
-        pass
+    except Exception:
+        # The player gets no result for this frame, the next one tries again
+        frame_errors += 1
+        traceback.print_exc()
 
-    await sio.emit('webcam_response', {'message': message}, to=sid)
+    load_controller.record(time.perf_counter() - arrived, sid)
+    # capturedAt is echoed so a client can tell which frame a response is for
+    await sio.emit('webcam_response', {'message': message, 'capturedAt': data.get('capturedAt')}, to=sid)
+    await send_capture_control(sid, state)
 
 
 # Run the FastAPI app
@@ -285,12 +626,12 @@ async def webcam_data(sid, data):
 #     uvicorn.run(app, host="127.0.0.1", port=8000)  # Running on port 8000, as port 3000 is taken by npm start
 
 
-        # lobby['players'][player_number]['emotion_history'] = [
-        #         entry for entry in lobby['players'][player_number]['emotion_history']
+        # player['emotion_history'] = [
+        #         entry for entry in player['emotion_history']
         #         if (time.time() - lobby['round_start_time'] - entry[0]) <= 6
         # ]
 
-        # history = lobby['players'][player_number]['emotion_history']
+        # history = player['emotion_history']
         # result= get_eigenFace_mse(image_np, history)
         
         # if result != None:
@@ -301,4 +642,4 @@ async def webcam_data(sid, data):
         # else:
         #     history_append = (time.time() - lobby['round_start_time'], (None, []))
         #     print('still no face detected')     
-        # lobby['players'][player_number]['emotion_history'].append(history_append)
\ No newline at end of file
+        # player['emotion_history'].append(history_append)
\ No newline at end of file
@@ -448,6 +448,10 @@ function connectWebSocket() {
         handleFaceDetectionUpdate(data.data)
       } else if (data.event === "face_detection_settings_update") {
         handleFaceDetectionSettingsUpdate(data.data)
+      } else if (data.type === "capture_control") {
+        handleCaptureControl(data)
+      } else if (data.type === "crop_request") {
+        handleCropRequest(data)
       } else if (data.type === "private_message") {
         handlePrivateMessage(data.message_type, data.message)
       } else if (data.type === "system") {
@@ -635,6 +639,46 @@ function getFaceDetectionStats() {
   sendMessage("get_face_detection_stats")
 }
 
+// Server-recommended capture rate and frame size, they follow the server's load
+let captureControl = { interval_ms: 0, degraded: false, max_width: 320, jpeg_quality: 0.8 }
+
+function captureInterval() {
+  const frequency = Number.parseInt(document.getElementById("sendDataFrequency").value) || 1000
+  return Math.max(frequency, captureControl.interval_ms)
+}
+
+function handleCaptureControl(control) {
+  const wasDegraded = captureControl.degraded
+  captureControl = control
+  if (control.degraded !== wasDegraded) {
+    addMessage(
+      control.degraded ? "warning" : "info",
+      control.degraded
+        ? `Server is busy, sending smaller frames every ${control.interval_ms}ms`
+        : "Server caught up, back to the normal frame rate",
+    )
+  }
+
+  // Restart the detection loop at the new rate
+  if (isDetecting && faceDetectionInterval) {
+    clearInterval(faceDetectionInterval)
+    faceDetectionInterval = setInterval(async () => {
+      await detectFaces()
+    }, captureInterval())
+  }
+}
+
+// Face crops the server asked for, to spot check our expressions against its own model.
+// "next" is one crop with the next frame, "always" one with every frame.
+let cropRequest = { next: false, always: false }
+
+function handleCropRequest(request) {
+  cropRequest = { next: true, always: request.always }
+  if (request.always) {
+    addMessage("Server no longer trusts the expressions alone, sending face crops with every frame", "system")
+  }
+}
+
 // Face Detection Response Handlers
 function handlePrivateMessage(messageType, message) {
   if (messageType === "success") {
@@ -1051,7 +1095,7 @@ function startFaceDetection() {
   toggleToCanvasView()
 
   isDetecting = true
-  const frequency = Number.parseInt(document.getElementById("sendDataFrequency").value) || 1000
+  const frequency = captureInterval()
 
   addMessage(
     "success",
@@ -1249,6 +1293,22 @@ function updateDetectionStats(faceCount, confidence, expressions = null) {
   }
 }
 
+// 48x48 grayscale crop of a face box, as base64 of the raw 2304 bytes
+const faceCropCanvas = document.createElement("canvas")
+faceCropCanvas.width = 48
+faceCropCanvas.height = 48
+
+function faceCrop48(box) {
+  const context = faceCropCanvas.getContext("2d", { willReadFrequently: true })
+  context.drawImage(videoElement, box.x, box.y, box.width, box.height, 0, 0, 48, 48)
+  const rgba = context.getImageData(0, 0, 48, 48).data
+  let binary = ""
+  for (let i = 0; i < rgba.length; i += 4) {
+    binary += String.fromCharCode(Math.round(0.299 * rgba[i] + 0.587 * rgba[i + 1] + 0.114 * rgba[i + 2]))
+  }
+  return btoa(binary)
+}
+
 function sendFaceDataToBackend(faceData, mode) {
   if (!ws || ws.readyState !== WebSocket.OPEN) return
 
@@ -1276,9 +1336,15 @@ function sendFaceDataToBackend(faceData, mode) {
       detectionData.detection_score = score
     }
 
-    if (faceData.expressions && mode === "emotion") {
+    if (faceData.expressions && (mode === "emotion" || mode === "both")) {
       detectionData.expressions = faceData.expressions
     }
+
+    // Without expressions the server predicts on the crop, with them it only spot checks on request
+    if (box && (!detectionData.expressions || cropRequest.next || cropRequest.always)) {
+      detectionData.crop = faceCrop48(box)
+      cropRequest.next = false
+    }
   }
 
   const message = {
@@ -1359,9 +1425,10 @@ async function detectAndSendFace() {
       `Cropping area: ${Math.round(cropWidth)}x${Math.round(cropHeight)} at (${Math.round(cropX)}, ${Math.round(cropY)})`,
     )
 
-    // Set canvas size to the cropped area
-    tempCanvas.width = cropWidth
-    tempCanvas.height = cropHeight
+    // Set canvas size to the cropped area, no wider than the server asks for
+    const outputScale = Math.min(1, captureControl.max_width / cropWidth)
+    tempCanvas.width = Math.round(cropWidth * outputScale)
+    tempCanvas.height = Math.round(cropHeight * outputScale)
 
     // Draw the cropped face area from the video
     tempContext.drawImage(
@@ -1372,12 +1439,12 @@ async function detectAndSendFace() {
       cropHeight, // Source rectangle
       0,
       0,
-      cropWidth,
-      cropHeight, // Destination rectangle
+      tempCanvas.width,
+      tempCanvas.height, // Destination rectangle
     )
 
     // Convert to base64
-    const imageDataUrl = tempCanvas.toDataURL("image/jpeg", 0.8)
+    const imageDataUrl = tempCanvas.toDataURL("image/jpeg", captureControl.jpeg_quality)
     const base64Data = imageDataUrl.split(",")[1] // Remove data:image/jpeg;base64, prefix
 
     addMessage("info", `Image data size: ${Math.round(base64Data.length / 1024)}KB`)
@@ -1387,6 +1454,8 @@ async function detectAndSendFace() {
       type: "upload_image",
       payload: {
         image_data: base64Data,
+        // Capture time, the server skips uploads that reach it too late
+        captured_at: Date.now(),
       },
     }
 
@@ -9,6 +9,12 @@ import { useWebSocket } from "@/hooks/use-websocket"
 import { set } from "date-fns"
 
 const API_BASE_URL = "https://cd6f-202-28-7-4.ngrok-free.app"
+// Frames captured per send, the server only analyses the sharpest one
+const BURST_FRAMES = 3
+const BURST_SPACING_MS = 60
+// Capture interval and frame size until the server sends a capture_control message
+const CAPTURE_INTERVAL_MS = 500
+const DEFAULT_CAPTURE_CONTROL = { interval_ms: 0, degraded: false, max_width: 320, jpeg_quality: 0.7 }
 
 export default function GamePage() {
   const [username, setUsername] = useState("")
@@ -26,6 +32,7 @@ export default function GamePage() {
   const [deathNotifications, setDeathNotifications] = useState([]) // Track active death notifications
   const [previousDeathNote, setPreviousDeathNote] = useState([]) // Track previous deaths to detect new ones
   const [faceDetected, setFaceDetected] = useState(false) // Track if face is currently detected
+  const captureControlRef = useRef(DEFAULT_CAPTURE_CONTROL) // Latest capture_control, read by detectAndSendFace
 
   const router = useRouter()
   const searchParams = useSearchParams()
@@ -41,6 +48,7 @@ export default function GamePage() {
     game_started,
     video_url,
     laughMeters,
+    captureControl,
     data,
     sendChatMessage,
     leaveLobby,
@@ -52,6 +60,7 @@ export default function GamePage() {
     unmutePlayer,
     changeSettings,
     sendMessage,
+    sendBinary,
     disconnect,
   } = useWebSocket(
     lobbyCode,
@@ -423,27 +432,39 @@ export default function GamePage() {
         return;
       }
 
-      tempCanvas.width = cropWidth;
-      tempCanvas.height = cropHeight;
-
-      tempContext.drawImage(
-        currentVideoElement,
-        cropX,
-        cropY,
-        cropWidth,
-        cropHeight,
-        0,
-        0,
-        cropWidth,
-        cropHeight
-      );
-
-      const imageDataUrl = tempCanvas.toDataURL("image/jpeg", 0.7);
-      const base64Data = imageDataUrl.split(",")[1];
+      // Frames are scaled down to the width the server asks for (smaller in degraded mode)
+      const control = captureControlRef.current;
+      const outputScale = Math.min(1, control.max_width / cropWidth);
+      tempCanvas.width = Math.round(cropWidth * outputScale);
+      tempCanvas.height = Math.round(cropHeight * outputScale);
+
+      // A short burst of the same face region, sent as one binary message with the JPEGs back to back
+      const blobs = [];
+      for (let i = 0; i < BURST_FRAMES; i++) {
+        if (i > 0) {
+          await new Promise((resolve) => setTimeout(resolve, BURST_SPACING_MS));
+        }
+        tempContext.drawImage(
+          currentVideoElement,
+          cropX,
+          cropY,
+          cropWidth,
+          cropHeight,
+          0,
+          0,
+          tempCanvas.width,
+          tempCanvas.height
+        );
+        const blob = await new Promise((resolve) => tempCanvas.toBlob(resolve, "image/jpeg", control.jpeg_quality));
+        if (blob) {
+          blobs.push(blob);
+        }
+      }
 
-      
-      if (sendMessage) {
-        sendMessage("upload_image", { image_data: base64Data })      }
+      // Raw JPEG bytes as a binary frame, no base64 overhead
+      if (sendBinary && blobs.length > 0) {
+        sendBinary(new Blob(blobs, { type: "image/jpeg" }));
+      }
 
     } catch (error) {
       console.error("Face crop and send error:", error);
@@ -472,6 +493,18 @@ export default function GamePage() {
     detectAndSendFace(); // Call the async function
   }
 
+  useEffect(() => {
+    if (captureControl) {
+      captureControlRef.current = captureControl;
+      if (captureControl.degraded) {
+        console.warn("Server is saturated, sending smaller frames every", captureControl.interval_ms, "ms");
+      }
+    }
+  }, [captureControl])
+
+  // The server's recommended interval, never faster than our own
+  const captureIntervalMs = Math.max(CAPTURE_INTERVAL_MS, captureControl?.interval_ms || 0)
+
   useEffect(() => {
     let intervalId;
     console.log("Setting up interval for face detection and sending image: VARABLES", {
@@ -482,14 +515,14 @@ export default function GamePage() {
     if (isConnected && modelsLoaded && faceApiLoaded) {
       intervalId = setInterval(() => {
         triggerFaceImageSend(); // Use the renamed wrapper function
-      }, 500);
+      }, captureIntervalMs);
     }
     return () => {
       if (intervalId) {
         clearInterval(intervalId);
       }
     };
-  }, [isConnected, modelsLoaded, faceApiLoaded, lobbyCode, username, sendMessage]); // Added relevant dependencies
+  }, [isConnected, modelsLoaded, faceApiLoaded, lobbyCode, username, sendMessage, sendBinary, captureIntervalMs]); // Restarts when the server changes the interval
 
   useEffect(() => {
     return () => {
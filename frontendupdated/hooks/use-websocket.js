@@ -14,6 +14,8 @@ export function useWebSocket(lobbyCode, username, userToken, role) {
   const [game_started, setGameStarted] = useState(false)
   const [video_url, setVideoUrl] = useState(null)
   const [laughMeters, setLaughMeters] = useState({}) // Added laughMeters state
+  // Recommended capture interval and frame size, sent by the server whenever its load changes them
+  const [captureControl, setCaptureControl] = useState(null)
   
   const [data, setData] = useState({})
   const socketRef = useRef(null)
@@ -85,7 +87,9 @@ export function useWebSocket(lobbyCode, username, userToken, role) {
     console.log("Received WebSocket message:", data)
     setData(data)
 
-    if (data.type === 'lobby.message') {
+    if (data.type === 'capture_control') {
+      setCaptureControl(data)
+    } else if (data.type === 'lobby.message') {
       console.log("Data Event:", data.event)
       // Handle different lobby events
       switch (data.event) {
@@ -284,6 +288,13 @@ export function useWebSocket(lobbyCode, username, userToken, role) {
     }
   }, [toast])
 
+  // Raw binary frame (e.g. a JPEG Blob), the server treats it as an upload_image
+  const sendBinary = useCallback((data) => {
+    if (socketRef.current && socketRef.current.readyState === WebSocket.OPEN) {
+      socketRef.current.send(data)
+    }
+  }, [])
+
   // Convenience methods for common actions
   const sendChatMessage = useCallback((text) => {
     sendMessage('chat_message', { text })
@@ -345,6 +356,7 @@ export function useWebSocket(lobbyCode, username, userToken, role) {
     game_started,
     video_url,
     laughMeters, // Return laughMeters
+    captureControl,
     data,
     sendChatMessage,
     leaveLobby,
@@ -356,6 +368,7 @@ export function useWebSocket(lobbyCode, username, userToken, role) {
     unmutePlayer,
     changeSettings,
     sendMessage,
+    sendBinary,
     disconnect,
   }
 }
@@ -0,0 +1 @@
+# Shared inference helpers for app.py and the Django API
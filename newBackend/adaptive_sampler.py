@@ -0,0 +1,116 @@
+"""
+Per-player sampling rate that follows how close a player is to laughing.
+
+A round is lost when Happy + Surprised goes over 0.8 often enough. A player
+sitting at 0.05 for seconds doesn't need a forward pass on every frame: their
+last result is reused until the next sample is due. How long that is depends
+on the last analysis:
+
+- the margin to the threshold: at ``near`` or closer every frame is analysed,
+  at ``far`` or more only one every ``max_interval`` seconds, linearly between,
+- how fast the score moves: at ``fast_rate`` per second or more every frame is
+  analysed, and a score heading for the threshold is sampled at least twice
+  before it could get there,
+- the picture: a frame whose lower face differs from the last analysed one by
+  ``wake_change`` gray levels or more (frame_gate.FaceChange) is analysed right
+  away, so the onset of a laugh is seen as fast as without the sampler (the
+  default is justified in newBackend/frame_gate.py).
+
+Frames that reuse a result are not new evidence, the caller leaves them out of
+the laugh window.
+"""
+import time
+from typing import Optional
+
+
+class SamplerStats:
+    """Frame counters shared by every player's sampler."""
+
+    def __init__(self):
+        self.frames = 0
+        self.sampled = 0
+
+    @property
+    def sample_rate(self) -> float:
+        return self.sampled / self.frames if self.frames else 0.0
+
+    def as_dict(self) -> dict:
+        return {'frames': self.frames, 'sampled': self.sampled, 'sample_rate': round(self.sample_rate, 4)}
+
+
+class AdaptiveSampler:
+    """
+    Decides per frame whether a player's face needs a fresh prediction.
+
+    :param threshold: The Happy + Surprised probability a laugh is decided at.
+    :param max_interval: Longest time, in seconds, a result is reused for.
+    :param near: Margin to the threshold under which every frame is analysed.
+    :param far: Margin to the threshold from which results are reused for ``max_interval``.
+    :param fast_rate: Change of the score per second from which every frame is analysed.
+    :param wake_change: Mean absolute difference (gray levels) of the lower face to the last
+        analysed frame that forces an analysis, None ignores the picture.
+    :param stats: Counters to add to, usually shared by every player.
+    """
+
+    def __init__(self, threshold: float = 0.8, max_interval: float = 1.0, near: float = 0.2, far: float = 0.6,
+                 fast_rate: float = 1.0, wake_change: Optional[float] = 4.0, stats: Optional[SamplerStats] = None):
+        self.threshold = threshold
+        self.max_interval = max_interval
+        self.near = near
+        self.far = far
+        self.fast_rate = fast_rate
+        self.wake_change = wake_change
+        self.stats = stats or SamplerStats()
+        self.interval = 0.0
+        self._score: Optional[float] = None
+        self._sampled_at: Optional[float] = None
+
+    def due(self, change: Optional[float] = None, now: Optional[float] = None) -> bool:
+        """
+        Checks whether a frame must be analysed.
+
+        :param change: Mean absolute difference of the frame's lower face to the last analysed
+            one (FaceChange.measure), None when unknown.
+        :param now: The frame's time, defaults to time.monotonic().
+        :return: True when the caller must run the pipeline and call ``update`` with the result,
+            False when the last result can be reused.
+        :rtype: bool
+        """
+        now = time.monotonic() if now is None else now
+        self.stats.frames += 1
+        reuse = (self._sampled_at is not None and now - self._sampled_at < self.interval
+                 and (change is None or self.wake_change is None or change < self.wake_change))
+        if reuse:
+            return False
+        self.stats.sampled += 1
+        return True
+
+    def update(self, score: float, now: Optional[float] = None) -> None:
+        """
+        Records a fresh prediction and sets the time until the next one.
+
+        :param score: The Happy + Surprised probability of the player's face.
+        :param now: The frame's time, defaults to time.monotonic().
+        """
+        now = time.monotonic() if now is None else now
+        margin = abs(self.threshold - score)
+        position = min(max((margin - self.near) / (self.far - self.near), 0.0), 1.0)
+        interval = position * self.max_interval
+
+        if self._score is not None and now > self._sampled_at:
+            rate = (score - self._score) / (now - self._sampled_at)
+            if abs(rate) >= self.fast_rate:
+                interval = 0.0
+            elif (rate > 0) == (score < self.threshold) and rate != 0:
+                # Heading for the threshold, sample at least twice before it could be crossed
+                interval = min(interval, margin / abs(rate) / 2)
+
+        self.interval = interval
+        self._score = score
+        self._sampled_at = now
+
+    def reset(self) -> None:
+        """Forgets the last prediction (e.g. the face was lost), the next frame is analysed."""
+        self._score = None
+        self._sampled_at = None
+        self.interval = 0.0
@@ -0,0 +1,159 @@
+"""
+Micro-batching queue for emotion inference.
+
+Face crops submitted from every connection are collected until either
+``max_batch_size`` crops are waiting or ``max_wait`` seconds have passed since
+the first one arrived, then they are run through the model in a single forward
+pass. Each caller awaits only its own row of the result.
+"""
+import asyncio
+import inspect
+from concurrent.futures import Executor
+from typing import Any, Callable, Optional, Sequence
+
+
+class InferenceBatcher:
+    """
+    Collects single inference requests into batches.
+
+    :param predict_fn: Called with a list of queued items, must return one result per item (in order).
+        May be a coroutine function (e.g. InferencePool.predict_batch), which is awaited directly.
+    :param max_batch_size: Upper bound on the number of items in one forward pass.
+    :param max_wait: Seconds to wait for more items after the first one of a batch arrives.
+    :param executor: Executor a plain ``predict_fn`` runs in (``None`` uses the loop's default thread pool).
+    :param max_concurrent_batches: Batches allowed to run at the same time, raise it when
+        ``predict_fn`` fans out to several processes.
+    """
+
+    def __init__(self, predict_fn: Callable[[list], Sequence[Any]], max_batch_size: int = 32,
+                 max_wait: float = 0.01, executor: Optional[Executor] = None,
+                 max_concurrent_batches: int = 1):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_concurrent_batches < 1:
+            raise ValueError("max_concurrent_batches must be at least 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.executor = executor
+        self.max_concurrent_batches = max_concurrent_batches
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Running batches, referenced so they aren't garbage collected mid-flight
+        self._dispatches: set[asyncio.Task] = set()
+
+        # Counters, handy when tuning max_batch_size / max_wait
+        self.batches_run = 0
+        self.items_run = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of items waiting for the next batch."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.items_run / self.batches_run if self.batches_run else 0.0
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Queues one item and waits for its result.
+
+        :param item: A single model input, e.g. a (48, 48, 1) face crop.
+        :return: The row of the batched prediction that belongs to ``item``.
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def submit_many(self, items: list) -> list:
+        """
+        Queues several items at once, e.g. every face of one frame, and waits for all their results.
+
+        The items are queued back to back, so they share one forward pass as long
+        as they fit in ``max_batch_size``.
+
+        :param items: Single model inputs.
+        :return: One result per item, in order.
+        """
+        if not items:
+            return []
+        self._ensure_worker()
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in items]
+        for item, future in zip(items, futures):
+            self._queue.put_nowait((item, future))
+        return list(await asyncio.gather(*futures))
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and not self._worker.done():
+            return
+        loop = asyncio.get_running_loop()
+        # The queue is created lazily so it binds to the loop uvicorn/daphne is running. A worker
+        # that died is restarted on the same queue, so the items waiting in it still get their results
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._loop = loop
+        self._worker = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                deadline = loop.time() + self.max_wait
+
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                # While every slot is busy the queue keeps filling, so the next batch is bigger
+                await self._slots.acquire()
+            except BaseException as e:
+                # The items taken off the queue would wait forever otherwise
+                error = e if isinstance(e, Exception) else RuntimeError("Inference batcher stopped")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                raise
+            task = loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: list) -> None:
+        try:
+            # Callers that gave up (e.g. disconnected) don't need a slot in the forward pass
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                return
+
+            items = [item for item, _ in batch]
+            try:
+                if inspect.iscoroutinefunction(self.predict_fn):
+                    results = await self.predict_fn(items)
+                else:
+                    results = await asyncio.get_running_loop().run_in_executor(self.executor, self.predict_fn, items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"predict_fn returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            self.batches_run += 1
+            self.items_run += len(items)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
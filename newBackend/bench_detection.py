@@ -0,0 +1,128 @@
+"""
+Benchmark of the face detector backends, full-frame and hinted.
+
+Usage (from the repository root):
+
+    python -m newBackend.bench_detection path/to/images --detectors haar,yunet --repeat 20
+
+The image directory holds one face per image, or pass ``--labels`` with a CSV
+of ``filename,x,y,w,h`` ground-truth boxes. For every detector it reports:
+
+- full-frame frames/sec and recall (share of faces found, IoU of 0.5 or more
+  with the label, or any face at all without labels),
+- hinted frames/sec, the search app.py runs once it knows where the face was:
+  the detector gets the found box, shifted and resized a little like the
+  previous frame's detection would be, and agreement is the share of those
+  faces it finds again.
+"""
+import argparse
+import csv
+import os
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from newBackend.face_detection import DETECTORS, create_detector
+from newBackend.frame_decode import image_files
+
+
+def iou(a: tuple[int, int, int, int], b: tuple[int, int, int, int]) -> float:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = max(min(ax + aw, bx + bw) - max(ax, bx), 0)
+    h = max(min(ay + ah, by + bh) - max(ay, by), 0)
+    union = aw * ah + bw * bh - w * h
+    return w * h / union if union else 0.0
+
+
+def jitter(box: tuple[int, int, int, int], rng: np.random.Generator, amount: float) -> tuple[int, int, int, int]:
+    """Moves and resizes a box by up to ``amount`` of its size, like a face between two frames."""
+    x, y, w, h = box
+    dx, dy, ds = rng.uniform(-amount, amount, 3)
+    return int(x + dx * w), int(y + dy * h), max(int(w * (1 + ds)), 1), max(int(h * (1 + ds)), 1)
+
+
+def time_call(fn, repeat: int) -> tuple[float, list]:
+    result = fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def load_labels(path: Optional[str]) -> dict[str, tuple[int, int, int, int]]:
+    if not path:
+        return {}
+    with open(path, newline='') as f:
+        return {row[0]: tuple(int(v) for v in row[1:5]) for row in csv.reader(f) if row and not row[0].startswith('#')}
+
+
+def bench_detector(name: str, images: list[tuple[str, np.ndarray]], labels: dict, repeat: int,
+                   amount: float, seed: int) -> None:
+    try:
+        detector = create_detector(name)
+    except (FileNotFoundError, RuntimeError) as e:
+        print(f"{name:>6}: skipped ({e})")
+        return
+
+    rng = np.random.default_rng(seed)
+    full_times, hinted_times = [], []
+    recalled = agreed = 0
+    for filename, gray in images:
+        full_time, faces = time_call(lambda: detector.detect(gray), repeat)
+        full_times.append(full_time)
+
+        label = labels.get(filename)
+        if label is not None:
+            matches = [face for face in faces if iou(label, face) >= 0.5]
+        else:
+            matches = faces
+        if not matches:
+            continue
+        recalled += 1
+
+        reference = max(matches, key=lambda f: f[2] * f[3])
+        hint = jitter(reference, rng, amount)
+        hinted_time, hinted = time_call(lambda: detector.detect(gray, hint), repeat)
+        hinted_times.append(hinted_time)
+        if any(iou(reference, face) >= 0.5 for face in hinted):
+            agreed += 1
+
+    full_ms = np.mean(full_times) * 1000
+    line = f"{name:>6}: full {full_ms:8.2f} ms ({1000 / full_ms:7.1f} fps), recall {recalled}/{len(images)}"
+    if hinted_times:
+        hinted_ms = np.mean(hinted_times) * 1000
+        line += (f" | hinted {hinted_ms:8.2f} ms ({1000 / hinted_ms:7.1f} fps, {full_ms / hinted_ms:5.1f}x),"
+                 f" agreement {agreed}/{recalled}")
+    print(line)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Face detector backends, full-frame and hinted")
+    ap.add_argument("images", help="directory of images with one face each")
+    ap.add_argument("--detectors", default=','.join(DETECTORS), help="comma separated backends to compare")
+    ap.add_argument("--labels", help="CSV of filename,x,y,w,h ground-truth face boxes")
+    ap.add_argument("--repeat", type=int, default=20, help="timed runs per image and mode")
+    ap.add_argument("--jitter", type=float, default=0.1, help="hint shift/resize, as a fraction of the face size")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    images = []
+    for path in image_files(args.images):
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is not None:
+            images.append((os.path.basename(path), gray))
+    if not images:
+        print("No images found")
+        return
+
+    labels = load_labels(args.labels)
+    print(f"Images: {len(images)}, labelled: {sum(filename in labels for filename, _ in images)}")
+    for name in args.detectors.split(','):
+        bench_detector(name.strip(), images, labels, args.repeat, args.jitter, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+Expression results computed by the client, and spot checks of them.
+
+Browsers that run face-api's ``face_expression_model`` already have a
+probability per expression for every frame. Sending that vector (7 numbers)
+instead of an image costs the server nothing to use, but the client could send
+anything, so a sampled share of frames is checked: the server asks the client
+for the 48x48 grayscale face crop of its next frame, runs its own model on it,
+and compares the laugh decisions (Happy + Surprised over the laugh threshold or
+not). A player whose vectors disagree with the server too often (or who keeps
+sending no crop when one is asked for) is no longer trusted, and from then on
+only their crops count, predicted by the server.
+
+Comparing the decisions instead of the scores closes the gap a score
+tolerance leaves: with a tolerance of 0.4 a client could report 0.79 for a
+face the server scores 1.0 and never laugh. face-api's model is not the
+server's, so only faces the server puts within ``margin`` of the threshold
+may be decided either way. A face the server clearly scores as laughing must
+be reported as laughing. Frames that carry only a crop have no client
+result, the server predicts them and there is nothing to check.
+"""
+import base64
+import math
+import random
+from collections import deque
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+
+# face-api expression names, by index of the server model's classes (see emotion_dict)
+FACE_API_LABELS = ('angry', 'disgusted', 'fearful', 'happy', 'neutral', 'sad', 'surprised')
+
+CROP_SIZE = 48
+
+
+def expression_vector(expressions: Union[dict, list]) -> np.ndarray:
+    """
+    Validates an expression vector sent by a client.
+
+    :param expressions: face-api's ``{name: probability}`` dict, or 7 probabilities in the
+        order of the server model's classes.
+    :return: A (7,) float32 array in the server model's class order.
+    :rtype: np.ndarray
+    :raises ValueError: When a class is missing, a value is not a probability, or they don't sum to 1.
+    """
+    if isinstance(expressions, dict):
+        missing = [name for name in FACE_API_LABELS if name not in expressions]
+        if missing:
+            raise ValueError(f"Missing expressions: {', '.join(missing)}")
+        values = [expressions[name] for name in FACE_API_LABELS]
+    elif isinstance(expressions, (list, tuple)) and len(expressions) == len(FACE_API_LABELS):
+        values = list(expressions)
+    else:
+        raise ValueError(f"Expected a dict of expressions or {len(FACE_API_LABELS)} probabilities")
+
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v) for v in values):
+        raise ValueError("Expression probabilities must be numbers")
+    vector = np.asarray(values, dtype=np.float32)
+    if vector.min() < 0 or vector.max() > 1 or abs(float(vector.sum()) - 1) > 0.05:
+        raise ValueError("Expression probabilities must be between 0 and 1 and sum to 1")
+    return vector
+
+
+def decode_crop(data: Union[bytes, str]) -> np.ndarray:
+    """
+    Decodes a face crop sent by a client.
+
+    :param data: The crop as bytes or base64: 48 * 48 raw grayscale bytes, or a 48x48 encoded image.
+    :return: A (48, 48, 1) uint8 crop, as the model takes it.
+    :rtype: np.ndarray
+    :raises ValueError: When it is not a 48x48 image.
+    """
+    if isinstance(data, str):
+        try:
+            data = base64.b64decode(data.split(',')[-1], validate=True)
+        except ValueError:
+            raise ValueError("Crop is not valid base64") from None
+
+    if len(data) == CROP_SIZE * CROP_SIZE:
+        crop = np.frombuffer(data, np.uint8).reshape(CROP_SIZE, CROP_SIZE)
+    else:
+        crop = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if crop is None or crop.shape != (CROP_SIZE, CROP_SIZE):
+            raise ValueError(f"Crop must be a {CROP_SIZE}x{CROP_SIZE} grayscale image")
+    return crop.reshape(CROP_SIZE, CROP_SIZE, 1)
+
+
+def laugh_score(probabilities: np.ndarray) -> float:
+    """Happy + Surprised, the probability the laugh decisions are made on."""
+    return float(probabilities[3] + probabilities[6])
+
+
+class SpotCheckStats:
+    """Counters of client expression vectors, shared by every player's verifier."""
+
+    def __init__(self):
+        self.frames = 0
+        self.checks = 0
+        self.failures = 0
+        self.distrusted = 0
+
+    @property
+    def client_share(self) -> float:
+        """Share of the frames decided on the client's vector alone, without server inference."""
+        return (self.frames - self.checks) / self.frames if self.frames else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'frames': self.frames,
+            'checks': self.checks,
+            'failures': self.failures,
+            'distrusted': self.distrusted,
+            'client_share': round(self.client_share, 4),
+        }
+
+
+class ClientVerifier:
+    """
+    Spot checks one player's expression vectors.
+
+    :param threshold: The Happy + Surprised probability a laugh is decided at.
+    :param check_rate: Share of the frames checked against the server model.
+    :param margin: Distance of the server's score to ``threshold`` within which the client's
+        decision may differ. 0.1 covers where face-api and the server model disagree on the
+        same borderline face. Outside of it the decisions must match.
+    :param window: Recent checks that count.
+    :param max_failures: Failed checks within ``window`` after which the player is no longer trusted.
+    :param grace: Frames without a crop accepted after one was asked for, they may have been sent
+        before the request arrived. The next one counts as a failed check.
+    :param stats: Counters to add to, usually shared by every player.
+    """
+
+    def __init__(self, threshold: float = 0.8, check_rate: float = 0.1, margin: float = 0.1, window: int = 10,
+                 max_failures: int = 3, grace: int = 3, stats: Optional[SpotCheckStats] = None):
+        self.threshold = threshold
+        self.check_rate = check_rate
+        self.margin = margin
+        self.max_failures = max_failures
+        self.grace = grace
+        self.stats = stats or SpotCheckStats()
+        self.trusted = True
+        # Frames received since a crop was asked for, None while none is
+        self.asked: Optional[int] = None
+        self._results: deque[bool] = deque(maxlen=window)
+
+    def wants_check(self) -> bool:
+        """
+        Decides for one frame whether the server model must run on its crop.
+
+        :return: True for a sampled frame, for every frame while an asked for crop is
+            outstanding, and always once the player is no longer trusted.
+        :rtype: bool
+        """
+        self.stats.frames += 1
+        if self.asked is not None:
+            return True
+        check = not self.trusted or random.random() < self.check_rate
+        if check:
+            self.stats.checks += 1
+        return check
+
+    def ask(self) -> None:
+        """Notes that the client was asked for a crop, because a check is due on a frame without one."""
+        self.asked = 0
+
+    def answered(self) -> None:
+        """Notes that the crop asked for arrived, its check is on the way to ``record``."""
+        self.asked = None
+
+    def missed(self, client: np.ndarray) -> bool:
+        """
+        Records a frame without a crop while one is asked for.
+
+        :param client: The frame's vector.
+        :return: True when ``grace`` ran out and it counted as a failed check.
+        :rtype: bool
+        """
+        self.asked += 1
+        if self.asked <= self.grace:
+            return False
+        self.asked = None
+        self.record(client, None)
+        return True
+
+    def agrees(self, client: np.ndarray, server: np.ndarray) -> bool:
+        """Whether the client's vector leads to the server's laugh decision (see ``margin``)."""
+        server_score = laugh_score(server)
+        if abs(server_score - self.threshold) <= self.margin:
+            return True
+        return (laugh_score(client) > self.threshold) == (server_score > self.threshold)
+
+    def record(self, client: np.ndarray, server: Optional[np.ndarray]) -> bool:
+        """
+        Records the outcome of a check, for a frame ``wants_check`` sampled or the crop ``ask`` asked for.
+
+        :param client: The client's vector.
+        :param server: The server's prediction for the crop, None when a check was due but
+            the client sent no crop, which counts as a failure.
+        :return: Whether the check passed.
+        :rtype: bool
+        """
+        passed = server is not None and self.agrees(client, server)
+        self._results.append(passed)
+        if not passed:
+            self.stats.failures += 1
+            if self.trusted and self._results.count(False) >= self.max_failures:
+                self.trusted = False
+                self.stats.distrusted += 1
+        return passed
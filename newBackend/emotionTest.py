@@ -5,10 +5,11 @@ from typing import Literal
 import numpy as np
 import argparse
 import cv2
-from keras_core.models import Sequential
-from keras_core.layers import Dense, Dropout, Flatten
-from keras_core.layers import Conv2D, MaxPooling2D
 import os
+
+# Run from the repository root, like the other newBackend tools: python -m newBackend.emotionTest
+from newBackend.laugh_scoring import LaughScorer
+from newBackend.model_registry import get_cascade, get_model
 # import matplotlib.pyplot as plt
 
 # Suppress unnecessary logs
@@ -27,26 +28,6 @@ ap.add_argument("--mode", help="train/display")
 a = ap.parse_args()
 mode = a.mode
 
-# Create the model
-model = Sequential()
-
-# Add layers
-model.add(Conv2D(32, kernel_size=(3, 3), activation='relu', input_shape=(48, 48, 1)))
-model.add(Conv2D(64, kernel_size=(3, 3), activation='relu'))
-model.add(MaxPooling2D(pool_size=(2, 2)))
-model.add(Dropout(0.25))
-
-model.add(Conv2D(128, kernel_size=(3, 3), activation='relu'))
-model.add(MaxPooling2D(pool_size=(2, 2)))
-model.add(Conv2D(128, kernel_size=(3, 3), activation='relu'))
-model.add(MaxPooling2D(pool_size=(2, 2)))
-model.add(Dropout(0.25))
-
-model.add(Flatten())
-model.add(Dense(1024, activation='relu'))
-model.add(Dropout(0.5))
-model.add(Dense(7, activation='softmax'))
-
 # Disable OpenCL to avoid unnecessary logs
 cv2.ocl.setUseOpenCL(False)
 
@@ -57,39 +38,39 @@ emotion_history: list[float] = []
 # Frame rate for webcam
 frame_rate: int | float = 5
 
-# Load pre-trained weights
-model.load_weights('model.h5')
+# Load pre-trained weights and the face detector (run from the repository root: python -m newBackend.emotionTest)
+model = get_model()
+facecasc = get_cascade()
 
 # Function to predict emotion
-def predict_emotion(frame: np.ndarray) -> list:
+def predict_emotion(frame: np.ndarray, annotate: bool = False) -> list:
     """
     Predicts the emotion from a given frame.
 
     :param frame: The input frame from the webcam.
     :type frame: np.ndarray
+    :param annotate: Draw each face's box and emotion onto ``frame``.
+    :type annotate: bool
     :return: A list of predictions for each detected face in the frame.
     :rtype: list
     """
-    facecasc = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
     faces = facecasc.detectMultiScale(gray, scaleFactor=1.3, minNeighbors=5)
-    preds = []
+    if len(faces) == 0:
+        return []
 
-    for (x, y, w, h) in faces:
-        # Draw a rectangle around the face
-        cv2.rectangle(frame, (x, y-50), (x+w, y+h+10), (255, 0, 0), 2)
+    # Process the region of interest of every face, and predict them all in one forward pass
+    cropped_imgs = np.stack([np.expand_dims(cv2.resize(gray[y:y + h, x:x + w], (48, 48)), -1) for (x, y, w, h) in faces])
+    preds = list(model.predict(cropped_imgs, verbose=0))
 
-        # Process the region of interest
-        roi_gray = gray[y:y + h, x:x + w]
-        cropped_img = np.expand_dims(np.expand_dims(cv2.resize(roi_gray, (48, 48)), -1), 0)
+    if annotate:
+        for (x, y, w, h), prediction in zip(faces, preds):
+            # Draw a rectangle around the face
+            cv2.rectangle(frame, (x, y-50), (x+w, y+h+10), (255, 0, 0), 2)
 
-        # Predict emotion
-        prediction = model.predict(cropped_img, verbose=0)
-        preds.append(prediction[0])
-
-        # Get emotion with max probability
-        maxindex = int(np.argmax(prediction))
-        cv2.putText(frame, emotion_dict[maxindex], (x+20, y-60), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2, cv2.LINE_AA)
+            # Get emotion with max probability
+            maxindex = int(np.argmax(prediction))
+            cv2.putText(frame, emotion_dict[maxindex], (x+20, y-60), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2, cv2.LINE_AA)
 
     return preds
 
@@ -105,7 +86,8 @@ if __name__ == '__main__':
 
     n: int | float = 3
     # grace period for the client to be happy or surprised to adjust to the game
-    happySurpriseLast: list[float] = list()
+    # the client loses once more than 30% of their frames of the last n seconds are happy or surprised
+    scorer = LaughScorer(window=n, threshold=0.8, ratio=0.3)
     cap = cv2.VideoCapture(1)
     ret, frame = cap.read()
     if not ret or np.mean(frame) < 5:  # Check if frame is all black or nearly black
@@ -117,7 +99,7 @@ if __name__ == '__main__':
     prev: float = time.time()
     start_Time: float = time.time()
     no_face: float = time.time()
-    while time.time() - start_Time < n or len(happySurpriseLast) >= n * frame_rate / 3 or no_face - time.time() > 1:
+    while time.time() - start_Time < n or no_face - time.time() > 1:
         # time for client to adjust to the game
         time_elapsed = time.time() - prev
         if time_elapsed > 1. / frame_rate:
@@ -127,7 +109,7 @@ if __name__ == '__main__':
         ret, frame = cap.read()
         if not ret:
             break
-        emotions = predict_emotion(frame)
+        emotions = predict_emotion(frame, annotate=True)
         if len(emotions) == 0:
             if time.time() - no_face > 1:
                 print(f"{Colors.RED}❎ No face detected{Colors.RESET}")
@@ -166,7 +148,7 @@ if __name__ == '__main__':
         flag = False
         if not ret:
             break
-        emotions = predict_emotion(frame)
+        emotions = predict_emotion(frame, annotate=True)
         if len(emotions) == 0:
             if time.time() - no_face > 1:
                 print(f"{Colors.RED}❎ No face detected{Colors.RESET}")
@@ -175,19 +157,9 @@ if __name__ == '__main__':
             if i[3] + i[6] >= 0.8:
                 flag = True
                 emotion_history.append(time.time() - start_Time)
-        if flag:
-            index = 0
-            happySurpriseLast.append(time.time() - start_Time)
-            for i in range(len(happySurpriseLast)):
-                if time.time() - start_Time - happySurpriseLast[i] > n:
-                    index = i
-                    break
-                else:
-                    break
-            happySurpriseLast = happySurpriseLast[index:]
-            if len(happySurpriseLast) >= n * frame_rate / 3:
-                print(f"{Colors.RED}❌ You Lose {Colors.RESET}")
-                break
+        if len(emotions) > 0 and scorer.update('client', max(i[3] + i[6] for i in emotions)):
+            print(f"{Colors.RED}❌ You Lose {Colors.RESET}")
+            break
         flag = False
         cv2.imshow('Video', cv2.resize(frame, (1600, 960), interpolation=cv2.INTER_CUBIC))
         if cv2.waitKey(1) & 0xFF == ord('q'):
@@ -201,7 +173,8 @@ if __name__ == '__main__':
     # plt.show()
     n: int | float = 3
     # grace period for the client to be happy or surprised to adjust to the game
-    happySurpriseLast: list[float] = list()
+    # the client loses once more than 30% of their frames of the last n seconds are happy or surprised
+    scorer = LaughScorer(window=n, threshold=0.8, ratio=0.3)
     cap = cv2.VideoCapture(0)
     # 7 emotions: angry, disgusted, fearful, happy, neutral, sad, surprised
     emojis = ["😠", "🤢", "😨", "😄", "😐", "😢", "😲"]
@@ -209,7 +182,7 @@ if __name__ == '__main__':
     prev: float = time.time()
     start_Time: float = time.time()
     no_face: float = time.time()
-    while time.time() - start_Time < n or len(happySurpriseLast) >= n * frame_rate / 3 or no_face - time.time() > 1:
+    while time.time() - start_Time < n or no_face - time.time() > 1:
         # time for client to adjust to the game
         time_elapsed = time.time() - prev
         if time_elapsed > 1. / frame_rate:
@@ -219,7 +192,7 @@ if __name__ == '__main__':
         ret, frame = cap.read()
         if not ret:
             break
-        emotions = predict_emotion(frame)
+        emotions = predict_emotion(frame, annotate=True)
         if len(emotions) == 0:
             if time.time() - no_face > 1:
                 print(f"{Colors.RED}❎ No face detected{Colors.RESET}")
@@ -258,7 +231,7 @@ if __name__ == '__main__':
         flag = False
         if not ret:
             break
-        emotions = predict_emotion(frame)
+        emotions = predict_emotion(frame, annotate=True)
         if len(emotions) == 0:
             if time.time() - no_face > 1:
                 print(f"{Colors.RED}❎ No face detected{Colors.RESET}")
@@ -267,19 +240,9 @@ if __name__ == '__main__':
             if i[3] + i[6] >= 0.8:
                 flag = True
                 emotion_history.append(time.time() - start_Time)
-        if flag:
-            index = 0
-            happySurpriseLast.append(time.time() - start_Time)
-            for i in range(len(happySurpriseLast)):
-                if time.time() - start_Time - happySurpriseLast[i] > n:
-                    index = i
-                    break
-                else:
-                    break
-            happySurpriseLast = happySurpriseLast[index:]
-            if len(happySurpriseLast) >= n * frame_rate / 3:
-                print(f"{Colors.RED}❌ You Lose {Colors.RESET}")
-                break
+        if len(emotions) > 0 and scorer.update('client', max(i[3] + i[6] for i in emotions)):
+            print(f"{Colors.RED}❌ You Lose {Colors.RESET}")
+            break
         flag = False
         cv2.imshow('Video', cv2.resize(frame, (1600, 960), interpolation=cv2.INTER_CUBIC))
         if cv2.waitKey(1) & 0xFF == ord('q'):
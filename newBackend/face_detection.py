@@ -0,0 +1,218 @@
+"""
+Face detector backends.
+
+Every detector takes a grayscale frame and an optional hint (the last known
+face box) and returns (x, y, w, h) boxes in frame coordinates:
+
+- ``haar``: the OpenCV Haar cascade. With a hint, the search only covers a
+  padded region around it, the region is downscaled so the face is about
+  ``target_face`` pixels wide, and ``minSize`` / ``maxSize`` keep the image
+  pyramid to the few scales the face can actually have.
+- ``yunet``: OpenCV's ``FaceDetectorYN`` (face_detection_yunet_2023mar.onnx from
+  the opencv_zoo repository).
+- ``ssd``: the ResNet-10 SSD through ``cv2.dnn`` (deploy.prototxt and
+  res10_300x300_ssd_iter_140000.caffemodel from OpenCV's face_detector sample).
+
+The DNN model files are not checked in, put them next to this file or point
+KRACKLE_YUNET_MODEL / KRACKLE_SSD_PROTOTXT / KRACKLE_SSD_WEIGHTS at them.
+Pick a backend with create_detector (KRACKLE_FACE_DETECTOR in app.py).
+"""
+import os
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from newBackend.model_registry import CASCADE_PATH, get_cascade
+
+Box = tuple[int, int, int, int]
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+YUNET_PATH = os.environ.get('KRACKLE_YUNET_MODEL', os.path.join(BASE_DIR, 'face_detection_yunet_2023mar.onnx'))
+SSD_PROTOTXT_PATH = os.environ.get('KRACKLE_SSD_PROTOTXT', os.path.join(BASE_DIR, 'deploy.prototxt'))
+SSD_WEIGHTS_PATH = os.environ.get('KRACKLE_SSD_WEIGHTS', os.path.join(BASE_DIR, 'res10_300x300_ssd_iter_140000.caffemodel'))
+
+# haarcascade_frontalface_default is trained on 24x24 windows, nothing smaller can be found
+MIN_WINDOW = 24
+
+
+def detect_faces_hinted(gray: np.ndarray, cascade: cv2.CascadeClassifier, hint: Optional[Box] = None,
+                        scale_factor: float = 1.3, min_neighbors: int = 5, target_face: int = 48,
+                        padding: float = 0.75, size_slack: float = 0.4, min_side: Optional[int] = None) -> list[Box]:
+    """
+    Detects faces, searching only where (and at the sizes) a hinted face can be.
+
+    :param gray: The grayscale frame.
+    :param cascade: The Haar cascade to run.
+    :param hint: The last known (x, y, w, h) face box, in ``gray`` coordinates.
+    :param scale_factor: Passed to detectMultiScale.
+    :param min_neighbors: Passed to detectMultiScale.
+    :param target_face: Width the hinted face is downscaled to before searching.
+    :param padding: Padding around the hint searched, as a fraction of its size.
+    :param size_slack: How much smaller or larger than the hint the face may be, as a fraction.
+    :param min_side: Without a hint, downscale the frame so its short side is this long (None searches it as is).
+    :return: The (x, y, w, h) box of every face, in ``gray`` coordinates.
+    :rtype: list[Box]
+    """
+    if hint is None:
+        factor = max(min(gray.shape[:2]) / min_side, 1.0) if min_side else 1.0
+        return _search(gray, cascade, (0, 0), factor, scale_factor, min_neighbors)
+
+    x, y, w, h = hint
+    factor = max(min(w, h) / target_face, 1.0)
+    min_size = max(int(min(w, h) * (1 - size_slack) / factor), MIN_WINDOW)
+    max_size = int(max(w, h) * (1 + size_slack) / factor) + 1
+
+    x0, y0, x1, y1 = _padded_region(hint, gray.shape, padding)
+    faces = _search(gray[y0:y1, x0:x1], cascade, (x0, y0), factor, scale_factor, min_neighbors, min_size, max_size)
+    if faces:
+        return faces
+
+    # The face moved out of the region, look for it (at the same size) in the whole frame
+    return _search(gray, cascade, (0, 0), factor, scale_factor, min_neighbors, min_size, max_size)
+
+
+def _search(region: np.ndarray, cascade: cv2.CascadeClassifier, offset: tuple[int, int], factor: float,
+            scale_factor: float, min_neighbors: int, min_size: int = 0, max_size: int = 0) -> list[Box]:
+    if factor > 1.0:
+        region = cv2.resize(region, (max(int(region.shape[1] / factor), 1), max(int(region.shape[0] / factor), 1)),
+                            interpolation=cv2.INTER_AREA)
+    if min(region.shape[:2]) < max(min_size, MIN_WINDOW):
+        return []
+
+    faces = cascade.detectMultiScale(region, scaleFactor=scale_factor, minNeighbors=min_neighbors,
+                                     minSize=(min_size, min_size), maxSize=(max_size, max_size))
+    return [(int(fx * factor) + offset[0], int(fy * factor) + offset[1], int(fw * factor), int(fh * factor))
+            for (fx, fy, fw, fh) in faces]
+
+
+def _padded_region(box: Box, shape: tuple[int, ...], padding: float) -> tuple[int, int, int, int]:
+    x, y, w, h = box
+    pad_x, pad_y = int(w * padding), int(h * padding)
+    return max(x - pad_x, 0), max(y - pad_y, 0), min(x + w + pad_x, shape[1]), min(y + h + pad_y, shape[0])
+
+
+def _clip_box(x0: float, y0: float, x1: float, y1: float, shape: tuple[int, ...]) -> Box:
+    x0, y0 = int(max(x0, 0)), int(max(y0, 0))
+    x1, y1 = int(min(x1, shape[1])), int(min(y1, shape[0]))
+    return x0, y0, x1 - x0, y1 - y0
+
+
+class FaceDetector:
+    """
+    Base class of the face detector backends.
+
+    Subclasses implement ``_detect`` for a whole image. ``detect`` runs it on a
+    padded region around the hint first, and on the whole frame if that finds nothing.
+    """
+
+    name = ''
+
+    def __init__(self, padding: float = 0.75):
+        self.padding = padding
+
+    def detect(self, gray: np.ndarray, hint: Optional[Box] = None) -> list[Box]:
+        """
+        Detects faces.
+
+        :param gray: The grayscale frame.
+        :param hint: The last known (x, y, w, h) face box, in ``gray`` coordinates.
+        :return: The (x, y, w, h) box of every face, in ``gray`` coordinates.
+        :rtype: list[Box]
+        """
+        if hint is not None:
+            x0, y0, x1, y1 = _padded_region(hint, gray.shape, self.padding)
+            faces = self._detect(gray[y0:y1, x0:x1])
+            if faces:
+                return [(x + x0, y + y0, w, h) for (x, y, w, h) in faces]
+        return self._detect(gray)
+
+    def _detect(self, gray: np.ndarray) -> list[Box]:
+        raise NotImplementedError
+
+
+class HaarFaceDetector(FaceDetector):
+    """The Haar cascade, with the size-aware hinted search of detect_faces_hinted."""
+
+    name = 'haar'
+
+    def __init__(self, cascade_path: str = CASCADE_PATH, scale_factor: float = 1.3, min_neighbors: int = 5,
+                 padding: float = 0.75):
+        super().__init__(padding)
+        self.cascade = get_cascade(cascade_path)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    def detect(self, gray: np.ndarray, hint: Optional[Box] = None) -> list[Box]:
+        return detect_faces_hinted(gray, self.cascade, hint, scale_factor=self.scale_factor,
+                                   min_neighbors=self.min_neighbors, padding=self.padding)
+
+    def _detect(self, gray: np.ndarray) -> list[Box]:
+        return self.detect(gray)
+
+
+class YuNetFaceDetector(FaceDetector):
+    """OpenCV's FaceDetectorYN (YuNet), a small CNN that runs on the CPU through cv2.dnn."""
+
+    name = 'yunet'
+
+    def __init__(self, model_path: str = YUNET_PATH, score_threshold: float = 0.6, nms_threshold: float = 0.3,
+                 padding: float = 0.75):
+        super().__init__(padding)
+        if not hasattr(cv2, 'FaceDetectorYN'):
+            raise RuntimeError("The yunet face detector needs OpenCV 4.5.4 or newer")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"YuNet model not found: {model_path}")
+        self._net = cv2.FaceDetectorYN.create(model_path, "", (320, 320), score_threshold, nms_threshold, 5000)
+
+    def _detect(self, gray: np.ndarray) -> list[Box]:
+        image = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR) if gray.ndim == 2 else gray
+        self._net.setInputSize((image.shape[1], image.shape[0]))
+        _, faces = self._net.detect(image)
+        if faces is None:
+            return []
+        return [_clip_box(x, y, x + w, y + h, image.shape) for (x, y, w, h) in faces[:, :4]]
+
+
+class SSDFaceDetector(FaceDetector):
+    """The ResNet-10 SSD face detector (300x300 input) through cv2.dnn."""
+
+    name = 'ssd'
+
+    def __init__(self, prototxt_path: str = SSD_PROTOTXT_PATH, weights_path: str = SSD_WEIGHTS_PATH,
+                 confidence: float = 0.5, padding: float = 0.75):
+        super().__init__(padding)
+        for path in (prototxt_path, weights_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"SSD face detector file not found: {path}")
+        self._net = cv2.dnn.readNetFromCaffe(prototxt_path, weights_path)
+        self.confidence = confidence
+
+    def _detect(self, gray: np.ndarray) -> list[Box]:
+        image = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR) if gray.ndim == 2 else gray
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(image, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+        self._net.setInput(blob)
+        detections = self._net.forward()[0, 0]
+
+        detections = detections[detections[:, 2] >= self.confidence]
+        boxes = [_clip_box(x0 * width, y0 * height, x1 * width, y1 * height, image.shape)
+                 for (x0, y0, x1, y1) in detections[:, 3:7]]
+        return [box for box in boxes if box[2] > 0 and box[3] > 0]
+
+
+DETECTORS: dict[str, type[FaceDetector]] = {
+    detector.name: detector for detector in (HaarFaceDetector, YuNetFaceDetector, SSDFaceDetector)
+}
+
+
+def create_detector(name: str = 'haar', **kwargs) -> FaceDetector:
+    """
+    Creates a face detector backend by name.
+
+    :param name: One of ``haar``, ``yunet`` or ``ssd``.
+    :param kwargs: Passed to the backend's constructor.
+    """
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown face detector '{name}', expected one of: {', '.join(DETECTORS)}")
+    return DETECTORS[name](**kwargs)
@@ -0,0 +1,90 @@
+"""
+Per-player face tracking between full Haar detections.
+
+Players sit still in front of their webcam, so the face is almost always close
+to where it was in the previous frame. The tracker follows the last box with a
+normalised template match inside a padded region around it, and asks for a full
+cascade detection only every ``redetect_every`` frames, when the match is weak,
+or when there is nothing to track.
+"""
+from typing import Optional
+
+import cv2
+import numpy as np
+
+Box = tuple[int, int, int, int]
+
+
+class FaceTracker:
+    """
+    Follows one face across frames of the same size.
+
+    :param redetect_every: Frames tracked before a full detection is asked for again.
+    :param min_confidence: Lowest ``TM_CCOEFF_NORMED`` score accepted as the same face.
+    :param search_padding: Padding around the last box searched, as a fraction of its size.
+    """
+
+    def __init__(self, redetect_every: int = 10, min_confidence: float = 0.6, search_padding: float = 0.5):
+        self.redetect_every = redetect_every
+        self.min_confidence = min_confidence
+        self.search_padding = search_padding
+
+        self.box: Optional[Box] = None
+        self.confidence = 0.0
+        self._template: Optional[np.ndarray] = None
+        self._frame_shape: Optional[tuple[int, ...]] = None
+        self._frames_since_detection = 0
+
+        # Counters, to check how often the cascade still runs
+        self.frames_tracked = 0
+        self.detections = 0
+
+    def track(self, gray: np.ndarray) -> Optional[Box]:
+        """
+        Looks for the face near its last position.
+
+        :param gray: The grayscale frame, same size as the one the face was detected on.
+        :type gray: np.ndarray
+        :return: The (x, y, w, h) box of the face, or None when a full detection should run.
+        :rtype: Optional[Box]
+        """
+        if self.box is None or self._frames_since_detection >= self.redetect_every or gray.shape != self._frame_shape:
+            return None
+
+        x, y, w, h = self.box
+        pad_x, pad_y = int(w * self.search_padding), int(h * self.search_padding)
+        x0, y0 = max(x - pad_x, 0), max(y - pad_y, 0)
+        x1, y1 = min(x + w + pad_x, gray.shape[1]), min(y + h + pad_y, gray.shape[0])
+        search = gray[y0:y1, x0:x1]
+        if search.shape[0] < h or search.shape[1] < w:
+            return None
+
+        scores = cv2.matchTemplate(search, self._template, cv2.TM_CCOEFF_NORMED)
+        _, confidence, _, (dx, dy) = cv2.minMaxLoc(scores)
+        self.confidence = float(confidence)
+        if confidence < self.min_confidence:
+            return None
+
+        self.box = (x0 + dx, y0 + dy, w, h)
+        self._frames_since_detection += 1
+        self.frames_tracked += 1
+        return self.box
+
+    def reset(self, gray: np.ndarray, box: Optional[Box]) -> None:
+        """
+        Starts tracking from a fresh detection.
+
+        :param gray: The frame the detection ran on.
+        :param box: The detected (x, y, w, h) face box, or None when no face was found.
+        """
+        self.detections += 1
+        self._frames_since_detection = 0
+        self._frame_shape = gray.shape
+        if box is None or box[2] <= 0 or box[3] <= 0:
+            self.box = self._template = None
+            return
+
+        x, y, w, h = box
+        self.box = (int(x), int(y), int(w), int(h))
+        # Copy, the frame may live in a reused buffer
+        self._template = gray[y:y + h, x:x + w].copy()
@@ -0,0 +1,105 @@
+"""
+Decodes incoming frames straight to a small grayscale array.
+
+libjpeg can scale by 1/2, 1/4 or 1/8 while decoding (``IMREAD_REDUCED_GRAYSCALE_*``),
+which skips most of the IDCT work and never materialises the full-resolution
+colour frame. The factor is picked from the size in the JPEG header, so the
+short side still has ``min_side`` pixels for the face detector.
+"""
+import os
+from typing import Optional
+
+import cv2
+import numpy as np
+
+# Image files the command line tools (bench_detection, model_export, loadtest) read from a directory
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Start-of-frame markers, they hold the image size (DHT, JPG and DAC share the range)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_READ_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def jpeg_size(data: bytes) -> Optional[tuple[int, int]]:
+    """
+    Reads the (width, height) of a JPEG from its header, without decoding it.
+
+    :param data: The encoded image.
+    :type data: bytes
+    :return: The size, or None if ``data`` is not a JPEG (or is truncated).
+    :rtype: Optional[tuple[int, int]]
+    """
+    if data[:2] != b'\xff\xd8':
+        return None
+
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a length field
+            i += 2
+            continue
+        if marker in _SOF_MARKERS:
+            if i + 9 > len(data):
+                return None
+            height = int.from_bytes(data[i + 5:i + 7], 'big')
+            width = int.from_bytes(data[i + 7:i + 9], 'big')
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], 'big')
+    return None
+
+
+def reduction_factor(width: int, height: int, min_side: int) -> int:
+    """The largest of 8, 4, 2 that keeps the short side at ``min_side`` pixels or more, else 1."""
+    for factor in (8, 4, 2):
+        if min(width, height) / factor >= min_side:
+            return factor
+    return 1
+
+
+def decode_gray(data: bytes, min_side: int = 240) -> tuple[np.ndarray, float]:
+    """
+    Decodes an encoded frame to grayscale, reduced in size as far as ``min_side`` allows.
+
+    :param data: The encoded frame (JPEG, or any format OpenCV reads, which is decoded at full size).
+    :type data: bytes
+    :param min_side: Smallest short side the decoded frame may have.
+    :type min_side: int
+    :return: The grayscale frame, and the factor to multiply its coordinates by to get
+        full-resolution coordinates.
+    :rtype: tuple[np.ndarray, float]
+    """
+    size = jpeg_size(data)
+    factor = reduction_factor(*size, min_side) if size else 1
+
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), _READ_FLAGS[factor])
+    if gray is None:
+        raise ValueError("Could not decode frame")
+
+    scale = size[0] / gray.shape[1] if size else 1.0
+    return gray, scale
+
+
+def scale_boxes(boxes: list[tuple[int, int, int, int]], scale: float) -> list[tuple[int, int, int, int]]:
+    """Maps (x, y, w, h) boxes found on a reduced frame back to full-resolution coordinates."""
+    if scale == 1.0:
+        return list(boxes)
+    return [tuple(int(round(v * scale)) for v in box) for box in boxes]
+
+
+def image_files(directory: str) -> list[str]:
+    """The paths of the IMAGE_EXTENSIONS files in a directory, sorted by name."""
+    return [os.path.join(directory, filename) for filename in sorted(os.listdir(directory))
+            if filename.lower().endswith(IMAGE_EXTENSIONS)]
@@ -0,0 +1,112 @@
+"""
+Shared-memory ring of fixed-size frame slots.
+
+The event loop writes a decoded grayscale frame into a free slot and hands only
+the slot index to an inference worker. The worker reads the frame in place,
+writes the (48, 48) face crops into the same slot, and the batched forward pass
+writes each face's probabilities back into the slot's result rows. Nothing but
+a few integers is pickled per frame, and no buffer is allocated per frame.
+"""
+import asyncio
+import contextlib
+import os
+import secrets
+from multiprocessing import shared_memory
+from typing import AsyncIterator, Optional
+
+import numpy as np
+
+
+class FrameRing:
+    """
+    Fixed-size frame, crop and result slots backed by ``multiprocessing.shared_memory``.
+
+    :param slots: Number of frames that can be in flight at once.
+    :param max_height: Largest frame height a slot can hold.
+    :param max_width: Largest frame width a slot can hold.
+    :param max_faces: Largest number of faces kept per frame.
+    :param name: Prefix of the shared memory blocks, only given when attaching from a worker.
+    """
+
+    def __init__(self, slots: int = 32, max_height: int = 720, max_width: int = 1280, max_faces: int = 8,
+                 name: Optional[str] = None):
+        self.slots = slots
+        self.max_height = max_height
+        self.max_width = max_width
+        self.max_faces = max_faces
+        self.owner = name is None
+        self.name = name or f'krackle_{secrets.token_hex(4)}'
+        # Only the creating process unlinks the blocks, not a process that inherited the ring by forking
+        self._creator_pid = os.getpid() if self.owner else None
+
+        shapes = {
+            'frames': ((slots, max_height, max_width), np.uint8),
+            'crops': ((slots, max_faces, 48, 48, 1), np.uint8),
+            'probs': ((slots, max_faces, 7), np.float32),
+        }
+        self._blocks: dict[str, shared_memory.SharedMemory] = {}
+        for key, (shape, dtype) in shapes.items():
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            if self.owner:
+                block = shared_memory.SharedMemory(name=f'{self.name}_{key}', create=True, size=size)
+            else:
+                block = shared_memory.SharedMemory(name=f'{self.name}_{key}')
+            self._blocks[key] = block
+            setattr(self, key, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+
+        self._free: Optional[asyncio.Queue] = None
+
+    @property
+    def spec(self) -> dict:
+        """Everything a worker needs to attach, see FrameRing.attach."""
+        return {'slots': self.slots, 'max_height': self.max_height, 'max_width': self.max_width,
+                'max_faces': self.max_faces, 'name': self.name}
+
+    @classmethod
+    def attach(cls, spec: dict) -> 'FrameRing':
+        """Maps a ring created by another process into this one."""
+        return cls(**spec)
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[int]:
+        """Waits for a free slot and hands it back once the caller is done with it."""
+        if self._free is None:
+            self._free = asyncio.Queue()
+            for index in range(self.slots):
+                self._free.put_nowait(index)
+        index = await self._free.get()
+        try:
+            yield index
+        finally:
+            self._free.put_nowait(index)
+
+    def write_frame(self, index: int, gray: np.ndarray) -> tuple[int, int, float]:
+        """
+        Copies a grayscale frame into a slot, shrinking it first if it is larger than a slot.
+
+        :return: The height and width stored in the slot, and the factor to multiply boxes
+            found in the slot by to get frame coordinates.
+        :rtype: tuple[int, int, float]
+        """
+        import cv2
+
+        height, width = gray.shape[:2]
+        scale = max(height / self.max_height, width / self.max_width, 1.0)
+        if scale > 1.0:
+            gray = cv2.resize(gray, (int(width / scale), int(height / scale)), interpolation=cv2.INTER_AREA)
+            height, width = gray.shape[:2]
+        self.frames[index, :height, :width] = gray
+        return height, width, scale
+
+    def frame(self, index: int, height: int, width: int) -> np.ndarray:
+        """A view (no copy) of the frame stored in a slot."""
+        return self.frames[index, :height, :width]
+
+    def close(self) -> None:
+        # The numpy views have to go before the buffers they point into can be closed
+        self.frames = self.crops = self.probs = None
+        for block in self._blocks.values():
+            block.close()
+            if self.owner and os.getpid() == self._creator_pid:
+                block.unlink()
+        self._blocks = {}
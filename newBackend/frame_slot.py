@@ -0,0 +1,115 @@
+"""
+Latest-frame-wins hand-off between a connection and its frame processing.
+
+A client sends frames on a timer whether or not the server kept up with the
+previous ones. Handled one by one, a slow frame makes the next ones queue up,
+and every result after that describes a face from seconds ago. Here a
+connection has a single slot: a new frame replaces the one still waiting in
+it (counted as dropped), and one task per connection processes whatever is in
+the slot, so at most one frame is in progress and one waits.
+
+Frames may carry the client's capture time (ms since the epoch, e.g.
+``Date.now()``). Client and server clocks differ, so the age of a frame is its
+delay beyond the smallest delay seen on that connection so far, which stands
+for the clock offset plus the network transit. Frames older than ``max_age``
+when their turn comes are discarded (counted as expired).
+"""
+import asyncio
+import time
+import traceback
+from typing import Any, Awaitable, Callable, Optional
+
+
+class SlotStats:
+    """Frame counters shared by every connection's slot."""
+
+    def __init__(self):
+        self.received = 0
+        self.dropped = 0
+        self.expired = 0
+        self.processed = 0
+
+    @property
+    def drop_rate(self) -> float:
+        """Share of the received frames that were replaced or expired before being processed."""
+        return (self.dropped + self.expired) / self.received if self.received else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'received': self.received,
+            'dropped': self.dropped,
+            'expired': self.expired,
+            'processed': self.processed,
+            'drop_rate': round(self.drop_rate, 4),
+        }
+
+
+class LatestFrameSlot:
+    """
+    Holds the newest unprocessed frame of one connection.
+
+    :param process: Coroutine function called with each frame that gets its turn.
+    :param max_age: Seconds a frame with a capture time may be late (beyond the connection's
+        smallest delay) and still be processed, None never discards frames.
+    :param stats: Counters to add to, usually shared by every connection.
+    """
+
+    def __init__(self, process: Callable[[Any], Awaitable[Any]], max_age: Optional[float] = None,
+                 stats: Optional[SlotStats] = None):
+        self.process = process
+        self.max_age = max_age
+        self.stats = stats or SlotStats()
+        self._pending: Optional[tuple[Any, Optional[float]]] = None
+        self._task: Optional[asyncio.Task] = None
+        # Smallest (arrival - capture) seen, in seconds: the clock offset plus the fastest transit
+        self._min_delay: Optional[float] = None
+
+    def offer(self, frame: Any, captured_at: Optional[float] = None) -> None:
+        """
+        Puts a frame in the slot, replacing the one waiting there, and makes sure it gets processed.
+
+        :param frame: Whatever ``process`` takes.
+        :param captured_at: The client's capture time in ms since the epoch, if it sent one.
+        """
+        self.stats.received += 1
+        if self._pending is not None:
+            self.stats.dropped += 1
+
+        delay = None
+        if captured_at is not None:
+            try:
+                delay = time.time() - float(captured_at) / 1000
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None and (self._min_delay is None or delay < self._min_delay):
+            self._min_delay = delay
+        # Stored as the capture time on the server's clock
+        self._pending = (frame, None if delay is None else time.time() - (delay - self._min_delay))
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._drain())
+
+    def age(self, captured: Optional[float]) -> float:
+        """Seconds since a frame's capture, on the server's clock (0 without a capture time)."""
+        return time.time() - captured if captured is not None else 0.0
+
+    async def _drain(self) -> None:
+        while self._pending is not None:
+            frame, captured = self._pending
+            self._pending = None
+            if self.max_age is not None and self.age(captured) > self.max_age:
+                self.stats.expired += 1
+                continue
+
+            try:
+                await self.process(frame)
+            except Exception:
+                # One bad frame must not stop the connection's later frames
+                traceback.print_exc()
+            self.stats.processed += 1
+
+    def close(self) -> None:
+        """Discards the waiting frame and cancels the one being processed, for a closed connection."""
+        self._pending = None
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
@@ -0,0 +1,245 @@
+"""
+Process pool for the CPU-heavy part of the emotion pipeline.
+
+Every worker process loads its own copy of the emotion model and the face
+detector once, when it starts. The event loop only awaits results, so a slow
+frame never stalls the other sockets, and one server process can use every core.
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from newBackend.face_detection import FaceDetector, create_detector
+from newBackend.frame_ring import FrameRing
+from newBackend.model_registry import get_model
+
+# Per-process state, filled in by _init_worker (or lazily when used in-process)
+_model = None
+_detector: Optional[FaceDetector] = None
+_ring: Optional[FrameRing] = None
+
+
+def _init_worker(model_path: Optional[str] = None, detector: str = 'haar', ring_spec: Optional[dict] = None,
+                 backend: str = 'keras') -> None:
+    """Loads the model and the face detector into the worker process, and maps the frame ring if there is one."""
+    global _ring
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    load_detector(detector)
+    _load_model(model_path, backend)
+    if ring_spec is not None:
+        _ring = FrameRing.attach(ring_spec)
+
+
+def load_detector(name: str = 'haar') -> None:
+    """Picks the face detector backend (see face_detection.create_detector) of this process."""
+    global _detector
+    import cv2
+
+    cv2.ocl.setUseOpenCL(False)
+    _detector = create_detector(name)
+
+
+def _load_model(model_path: Optional[str] = None, backend: str = 'keras') -> None:
+    global _model
+    # One interpreter thread per worker, the pool already uses every core
+    options = {'num_threads': 1} if backend == 'tflite' else {}
+    _model = get_model(backend, model_path, **options)
+
+
+def _find_faces(gray: np.ndarray, hint: Optional[tuple[int, int, int, int]] = None) -> list[tuple[int, int, int, int]]:
+    if _detector is None:
+        load_detector()
+    return _detector.detect(gray, hint)
+
+
+def crop_face(gray: np.ndarray, box: tuple[int, int, int, int]) -> np.ndarray:
+    """Cuts a face out of a grayscale frame as a (48, 48, 1) model input."""
+    import cv2
+
+    x, y, w, h = box
+    return np.expand_dims(cv2.resize(gray[y:y + h, x:x + w], (48, 48)), -1)
+
+
+def detect_faces(frame: np.ndarray, hint: Optional[tuple[int, int, int, int]] = None) -> tuple[list[tuple[int, int, int, int]], list[np.ndarray]]:
+    """
+    Finds the faces in a frame and cuts them out for the model.
+
+    :param frame: A BGR (or already grayscale) frame from the webcam.
+    :type frame: np.ndarray
+    :param hint: The last known (x, y, w, h) face box, narrows the search down (see detect_faces_hinted).
+    :type hint: Optional[tuple[int, int, int, int]]
+    :return: The (x, y, w, h) box of every face and its (48, 48, 1) grayscale crop.
+    :rtype: tuple[list[tuple[int, int, int, int]], list[np.ndarray]]
+    """
+    import cv2
+
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    boxes = _find_faces(gray, hint)
+    return boxes, [crop_face(gray, box) for box in boxes]
+
+
+def detect_faces_in_slot(index: int, height: int, width: int,
+                         hint: Optional[tuple[int, int, int, int]] = None) -> list[tuple[int, int, int, int]]:
+    """
+    Same as detect_faces, for a grayscale frame stored in the shared frame ring.
+
+    The frame is read in place and the crops are written to the slot's crop rows,
+    so only the boxes travel back to the event loop.
+
+    :return: The (x, y, w, h) box of every face kept, at most ``max_faces`` of them.
+    :rtype: list[tuple[int, int, int, int]]
+    """
+    gray = _ring.frame(index, height, width)
+    boxes = _find_faces(gray, hint)[:_ring.max_faces]
+    for face, box in enumerate(boxes):
+        _ring.crops[index, face] = crop_face(gray, box)
+    return boxes
+
+
+def predict_batch(crops: list[np.ndarray]) -> np.ndarray:
+    """
+    Runs one forward pass over a batch of face crops.
+
+    :param crops: A list of (48, 48, 1) grayscale face crops.
+    :type crops: list[np.ndarray]
+    :return: An (N, 7) array of probabilities, one row per crop.
+    :rtype: np.ndarray
+    """
+    if _model is None:
+        _load_model()
+    return _model.predict(np.stack(crops), verbose=0)
+
+
+def warm_up_worker() -> None:
+    """Runs one forward pass in a worker, so its first real batch doesn't pay for the setup."""
+    predict_batch([np.zeros((48, 48, 1), np.uint8)])
+
+
+def predict_slots(refs: list[tuple[int, int]]) -> None:
+    """
+    Same as predict_batch, for crops stored in the shared frame ring.
+
+    :param refs: (slot, face) pairs, the probabilities are written to ``probs[slot, face]``.
+    :type refs: list[tuple[int, int]]
+    """
+    slots, faces = [list(column) for column in zip(*refs)]
+    _ring.probs[slots, faces] = _model.predict(_ring.crops[slots, faces], verbose=0)
+
+
+class InferencePool:
+    """
+    Runs pipeline functions in a pool of worker processes.
+
+    :param workers: Number of worker processes, defaults to the number of cores.
+    :param max_in_flight: Upper bound on requests submitted to the pool at once, defaults to 2 per worker.
+        Further callers wait on the event loop instead of piling up in the pool's queue.
+    :param ring: Shared frame ring the workers map, so frames and crops are passed by slot index.
+    :param detector: Face detector backend the workers load (``haar``, ``yunet`` or ``ssd``).
+    :param model_backend: ``keras`` or ``numpy`` run model.h5, ``tflite`` its int8 export (see model_export.py).
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_in_flight: Optional[int] = None,
+                 ring: Optional[FrameRing] = None, detector: str = 'haar', model_backend: str = 'keras'):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 2 * self.workers
+        self.ring = ring
+        self.detector = detector
+        self.model_backend = model_backend
+        self.in_flight = 0
+        # Pools replaced after a worker died or failed to start
+        self.restarts = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # TensorFlow is not fork-safe, so the workers start from a clean interpreter
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(None, self.detector, self.ring.spec if self.ring else None, self.model_backend),
+            )
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs ``fn(*args)`` in a worker process and waits for the result.
+
+        When a worker dies (or its initializer fails, e.g. without model.h5) the
+        whole pool is broken: the call raises BrokenProcessPool and the next one
+        starts a new pool.
+
+        :param fn: A module-level (picklable) function, e.g. detect_faces or predict_batch.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        async with self._semaphore:
+            self.in_flight += 1
+            executor = self.executor
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                # Concurrent calls all fail on the same pool, only the first one replaces it
+                if executor is self._executor:
+                    print("[inference] Process pool broken, starting a new one", file=sys.stderr)
+                    self._executor = None
+                    self.restarts += 1
+                    executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            finally:
+                self.in_flight -= 1
+
+    async def detect_faces_in_slot(self, index: int, gray: np.ndarray, hint: Optional[tuple[int, int, int, int]] = None
+                                   ) -> tuple[list[tuple[int, int, int, int]], list[tuple[int, int]]]:
+        """
+        Runs face detection for a grayscale frame through the shared frame ring.
+
+        The caller must hold slot ``index`` (see ``FrameRing.slot``) until the
+        predictions for the returned references are in.
+
+        :return: The (x, y, w, h) box of every face in frame coordinates, and a
+            (slot, face) reference per face to submit to the batcher.
+        """
+        height, width, scale = self.ring.write_frame(index, gray)
+        if hint is not None:
+            hint = tuple(int(v / scale) for v in hint)
+        boxes = await self.run(detect_faces_in_slot, index, height, width, hint)
+        faces = [tuple(int(v * scale) for v in box) for box in boxes]
+        return faces, [(index, face) for face in range(len(boxes))]
+
+    def write_crops(self, index: int, crops: list[np.ndarray]) -> list[tuple[int, int]]:
+        """
+        Stores crops made on the event loop (e.g. of a tracked face) in a slot of the frame ring.
+
+        :return: A (slot, face) reference per crop to submit to the batcher.
+        """
+        crops = crops[:self.ring.max_faces]
+        for face, crop in enumerate(crops):
+            self.ring.crops[index, face] = crop
+        return [(index, face) for face in range(len(crops))]
+
+    async def predict_batch(self, items: list) -> list[np.ndarray]:
+        """
+        Coroutine version of predict_batch, usable as an InferenceBatcher predict_fn.
+
+        :param items: (48, 48, 1) crops, or (slot, face) references when the pool has a ring.
+        """
+        if self.ring is None:
+            return list(await self.run(predict_batch, items))
+        await self.run(predict_slots, items)
+        return [self.ring.probs[index, face].copy() for index, face in items]
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self.ring is not None:
+            self.ring.close()
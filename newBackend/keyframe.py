@@ -0,0 +1,125 @@
+"""
+Picks the sharpest frame of a client's burst for the face pipeline.
+
+Webcam frames are often motion blurred, and a blurred face gives an unreliable
+prediction for the same cost as a sharp one. In burst mode a client sends a
+few small frames per interval instead of one; each is decoded (the pipeline
+needs the decoded frame anyway) and scored by the variance of its Laplacian
+on a downscaled grayscale copy, which is high for crisp edges and drops with
+blur. Only the sharpest frame goes through detection and the model.
+
+A burst arrives as a list of frames, or as one binary message with the JPEGs
+back to back (``split_jpegs`` takes them apart).
+"""
+import base64
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+
+from newBackend.frame_decode import decode_gray
+
+# Short side, in pixels, frames (or face regions) are scored at
+SCORE_SIDE = 96
+
+# End of one JPEG directly followed by the start of the next
+_JPEG_BOUNDARY = b'\xff\xd9\xff\xd8'
+
+
+def frame_bytes(frame: Union[bytes, bytearray, str]) -> bytes:
+    """The encoded bytes of a frame sent as bytes, base64, or a base64 data URL."""
+    if isinstance(frame, (bytes, bytearray)):
+        return bytes(frame)
+    return base64.b64decode(frame.split(',')[-1])
+
+
+def split_jpegs(data: bytes) -> list[bytes]:
+    """
+    Splits JPEGs sent back to back in one message.
+
+    Inside a JPEG, 0xFF bytes of the compressed data are followed by 0x00, so an
+    end-of-image marker directly followed by a start-of-image one only occurs
+    between two images.
+
+    :param data: One or more concatenated JPEGs.
+    :return: The separate images (``[data]`` for a single one).
+    :rtype: list[bytes]
+    """
+    parts = data.split(_JPEG_BOUNDARY)
+    if len(parts) == 1:
+        return [data]
+    return ([parts[0] + b'\xff\xd9'] + [b'\xff\xd8' + part + b'\xff\xd9' for part in parts[1:-1]]
+            + [b'\xff\xd8' + parts[-1]])
+
+
+def sharpness(gray: np.ndarray, box: Optional[tuple[int, int, int, int]] = None) -> float:
+    """
+    Scores how sharp a grayscale frame is.
+
+    :param gray: The decoded frame.
+    :param box: An (x, y, w, h) region to score instead of the whole frame, e.g. the tracked face.
+    :return: The variance of the Laplacian, higher is sharper. Only comparable between
+        frames of the same scene.
+    :rtype: float
+    """
+    if box is not None:
+        x, y, w, h = box
+        region = gray[max(y, 0):y + h, max(x, 0):x + w]
+        if region.size:
+            gray = region
+
+    short_side = min(gray.shape[:2])
+    if short_side > SCORE_SIDE:
+        factor = SCORE_SIDE / short_side
+        gray = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+class KeyframeStats:
+    """Burst counters shared by every connection."""
+
+    def __init__(self):
+        self.bursts = 0
+        self.frames = 0
+
+    @property
+    def mean_burst_size(self) -> float:
+        return self.frames / self.bursts if self.bursts else 0.0
+
+    def as_dict(self) -> dict:
+        return {'bursts': self.bursts, 'frames': self.frames, 'mean_burst_size': round(self.mean_burst_size, 2)}
+
+
+def select_keyframe(frames: list[bytes], min_side: int = 240, box: Optional[tuple[int, int, int, int]] = None,
+                    stats: Optional[KeyframeStats] = None) -> tuple[int, np.ndarray, float]:
+    """
+    Decodes the frames of a burst and picks the sharpest one.
+
+    :param frames: The encoded frames.
+    :param min_side: Smallest short side the frames are decoded to, see decode_gray.
+    :param box: Region of the decoded frames to score, e.g. the tracked face box.
+    :param stats: Counters to add to, bursts of one frame are not counted.
+    :return: The index of the sharpest frame, the frame decoded, and its scale (see decode_gray).
+    :rtype: tuple[int, np.ndarray, float]
+    :raises ValueError: When no frame of the burst can be decoded.
+    """
+    if len(frames) == 1:
+        return (0, *decode_gray(frames[0], min_side=min_side))
+
+    if stats is not None:
+        stats.bursts += 1
+        stats.frames += len(frames)
+
+    best, best_score = None, -1.0
+    for i, frame in enumerate(frames):
+        try:
+            gray, scale = decode_gray(frame, min_side=min_side)
+        except ValueError:
+            continue
+        score = sharpness(gray, box)
+        if score > best_score:
+            best, best_score = (i, gray, scale), score
+
+    if best is None:
+        raise ValueError("Could not decode any frame of the burst")
+    return best
@@ -0,0 +1,165 @@
+"""
+Sliding-window laugh scoring for the players of a lobby.
+
+A frame counts as laughing when Happy + Surprised is over ``threshold``, and a
+player loses the round once more than ``ratio`` of their frames of the last
+``window`` seconds laughed. The last frames of every player sit in one
+fixed-capacity ring buffer (a row of a 2-D array per player) next to running
+sums of frames and laughing frames: a new frame overwrites one slot and adds
+to the sums, and frames leaving the window are subtracted from the sums as
+the tail moves past them. Nothing is reallocated per frame, and every frame
+costs O(1) (each one is added once and expired once).
+
+``meters`` expires and reports the whole lobby in a few array operations.
+"""
+import time
+from typing import Hashable, Optional
+
+import numpy as np
+
+
+class LaughScorer:
+    """
+    Keeps the laugh window of every player of one lobby.
+
+    :param window: Seconds of frames the ratio is taken over.
+    :param threshold: Happy + Surprised probability above which a frame counts as laughing.
+    :param ratio: Share of laughing frames in the window above which a player loses.
+    :param capacity: Frames kept per player, the oldest one is dropped when a window holds more
+        (128 covers 4 s at 30 fps).
+    :param min_frames: Frames a window must hold before it can decide a loss, so a single
+        laughing frame at the start of a round doesn't end it.
+    """
+
+    def __init__(self, window: float = 4.0, threshold: float = 0.8, ratio: float = 0.3, capacity: int = 128,
+                 min_frames: int = 3):
+        self.window = window
+        self.threshold = threshold
+        self.ratio = ratio
+        self.capacity = capacity
+        self.min_frames = min_frames
+
+        self._rows: dict[Hashable, int] = {}
+        self._free: list[int] = []
+        self._times = np.zeros((0, capacity), np.float64)
+        self._laughs = np.zeros((0, capacity), np.bool_)
+        # Next slot to write, oldest slot in the window, frames and laughing frames in the window
+        self._head = np.zeros(0, np.int64)
+        self._tail = np.zeros(0, np.int64)
+        self._frames = np.zeros(0, np.int64)
+        self._laughing = np.zeros(0, np.int64)
+        # Lost this round, and the meter at that moment (the meter itself may drop afterwards)
+        self._lost = np.zeros(0, np.bool_)
+        self._lost_meter = np.zeros(0, np.float64)
+
+    def __contains__(self, player: Hashable) -> bool:
+        return player in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add_player(self, player: Hashable) -> None:
+        """Gives a player an empty window. Reallocates the arrays only when every row is taken."""
+        if player in self._rows:
+            return
+        if not self._free:
+            old = len(self._head)
+            grown = max(4, 2 * old)
+            self._times = np.concatenate([self._times, np.zeros((grown - old, self.capacity), np.float64)])
+            self._laughs = np.concatenate([self._laughs, np.zeros((grown - old, self.capacity), np.bool_)])
+            for name in ('_head', '_tail', '_frames', '_laughing', '_lost', '_lost_meter'):
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate([array, np.zeros(grown - old, array.dtype)]))
+            self._free.extend(range(grown - 1, old - 1, -1))
+        row = self._free.pop()
+        self._clear(row)
+        self._rows[player] = row
+
+    def remove_player(self, player: Hashable) -> None:
+        row = self._rows.pop(player, None)
+        if row is not None:
+            self._free.append(row)
+
+    def reset(self) -> None:
+        """Empties every window, e.g. when a new round starts."""
+        self._clear(slice(None))
+
+    def _clear(self, rows) -> None:
+        self._head[rows] = self._tail[rows] = self._frames[rows] = self._laughing[rows] = 0
+        self._lost[rows] = False
+        self._lost_meter[rows] = 0.0
+
+    def _expire(self, rows: np.ndarray, now: float) -> None:
+        # Moves the tails past frames older than the window, one frame per row and pass
+        start = now - self.window
+        while len(rows):
+            tails = self._tail[rows]
+            old = (self._frames[rows] > 0) & (self._times[rows, tails] < start)
+            rows = rows[old]
+            if not len(rows):
+                return
+            tails = tails[old]
+            self._laughing[rows] -= self._laughs[rows, tails]
+            self._frames[rows] -= 1
+            self._tail[rows] = (tails + 1) % self.capacity
+
+    def update(self, player: Hashable, probability: float, now: Optional[float] = None) -> bool:
+        """
+        Adds one frame of a player.
+
+        :param player: The player, added to the scorer if needed.
+        :param probability: The frame's Happy + Surprised probability.
+        :param now: The frame's time in seconds, defaults to time.monotonic().
+        :return: Whether the player has lost the round (it stays lost until ``reset``).
+        :rtype: bool
+        """
+        now = time.monotonic() if now is None else now
+        self.add_player(player)
+        row = self._rows[player]
+        laugh = probability > self.threshold
+
+        self._expire(np.array([row]), now)
+        # A full ring drops its oldest frame to make room
+        if self._frames[row] == self.capacity:
+            tail = self._tail[row]
+            self._laughing[row] -= self._laughs[row, tail]
+            self._frames[row] -= 1
+            self._tail[row] = (tail + 1) % self.capacity
+
+        head = self._head[row]
+        self._times[row, head] = now
+        self._laughs[row, head] = laugh
+        self._head[row] = (head + 1) % self.capacity
+        self._frames[row] += 1
+        self._laughing[row] += laugh
+
+        meter = self._meters(np.array([row]))[0]
+        if not self._lost[row] and self._frames[row] >= self.min_frames and meter > 1.0:
+            self._lost[row] = True
+            self._lost_meter[row] = meter
+        return bool(self._lost[row])
+
+    def _meters(self, rows: np.ndarray) -> np.ndarray:
+        frames = self._frames[rows]
+        ratios = np.divide(self._laughing[rows], frames, out=np.zeros(len(rows)), where=frames > 0)
+        return ratios / self.ratio
+
+    def lost(self, player: Hashable) -> bool:
+        row = self._rows.get(player)
+        return row is not None and bool(self._lost[row])
+
+    def meters(self, now: Optional[float] = None) -> dict[Hashable, float]:
+        """
+        Expires old frames of every player and reports their laugh meters.
+
+        :param now: The current time in seconds, defaults to time.monotonic().
+        :return: Per player, the laughing share of the window relative to ``ratio``: over 1.0
+            means lost. A player who lost keeps at least the meter they lost with.
+        :rtype: dict[Hashable, float]
+        """
+        now = time.monotonic() if now is None else now
+        players = list(self._rows)
+        rows = np.fromiter(self._rows.values(), np.int64, len(players))
+        self._expire(rows, now)
+        meters = np.maximum(self._meters(rows), self._lost_meter[rows])
+        return {player: float(meter) for player, meter in zip(players, meters)}
@@ -0,0 +1,159 @@
+"""
+Server-driven capture rate: tells clients how often to send frames.
+
+Clients capture on a timer. When a node falls behind, a fixed rate only makes
+the queue longer, and a player's laugh is judged on frames from seconds ago.
+The controller watches how long frames take from their arrival at the server
+to their result (time spent waiting for their turn included) and how many
+crops wait for inference, and adjusts a recommended interval, once for the
+node and once for every player:
+
+- latency over ``target_latency`` or more than ``max_queue`` crops waiting:
+  the interval grows by half (up to ``max_interval``),
+- latency under half the target with a short queue: it shrinks by a tenth
+  (down to ``base_interval``).
+
+The node's interval follows the latency of all frames and is the floor for
+every player, which keeps the node under its CPU budget. A player's own
+interval follows the latency of their frames only, so a player whose frames
+take long (several faces, large frames) slows down further without slowing
+the others. Growing fast and shrinking slowly avoids oscillating around the
+target. Once the node's interval reaches ``degrade_factor`` times the base
+rate the node is saturated and switches to degraded mode, where clients also
+send smaller, more compressed frames. It leaves degraded mode when the
+interval is back at the base rate.
+"""
+import time
+from typing import Callable, Hashable, Optional
+
+# Frame size and JPEG quality clients are asked for, in normal and in degraded mode
+FRAME_WIDTH = 320
+DEGRADED_FRAME_WIDTH = 160
+JPEG_QUALITY = 0.8
+DEGRADED_JPEG_QUALITY = 0.5
+
+
+class Rate:
+    """The latency and recommended interval of the node or of one player."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        # Exponentially weighted mean of the frame latency, in seconds
+        self.latency = 0.0
+        self.frames = 0
+
+    def record(self, seconds: float) -> None:
+        self.latency = seconds if self.frames == 0 else 0.8 * self.latency + 0.2 * seconds
+        self.frames += 1
+
+
+class LoadController:
+    """
+    Recommends frame intervals from frame latency and inference queue depth.
+
+    :param queue_depth: Returns the number of crops waiting for inference, e.g. ``lambda: batcher.pending``.
+    :param base_interval: Seconds between frames when the node keeps up.
+    :param max_interval: Slowest rate ever recommended, in seconds between frames.
+    :param target_latency: Seconds a frame may take from arrival to result before the rate goes down.
+    :param max_queue: Crops waiting for inference before the rate goes down.
+    :param degrade_factor: Interval, as a multiple of ``base_interval``, that switches to degraded mode.
+    :param adjust_every: Seconds between two adjustments, so one slow frame doesn't count several times.
+    """
+
+    def __init__(self, queue_depth: Callable[[], int] = lambda: 0, base_interval: float = 0.5,
+                 max_interval: float = 3.0, target_latency: float = 0.25, max_queue: int = 64,
+                 degrade_factor: float = 2.0, adjust_every: float = 1.0):
+        self.queue_depth = queue_depth
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.target_latency = target_latency
+        self.max_queue = max_queue
+        self.degrade_factor = degrade_factor
+        self.adjust_every = adjust_every
+
+        self.node = Rate(base_interval)
+        self.players: dict[Hashable, Rate] = {}
+        self.degraded = False
+        self._adjusted = time.monotonic()
+
+    @property
+    def interval(self) -> float:
+        return self.node.interval
+
+    @property
+    def latency(self) -> float:
+        return self.node.latency
+
+    @property
+    def frames(self) -> int:
+        return self.node.frames
+
+    def record(self, seconds: float, player: Optional[Hashable] = None) -> None:
+        """
+        Adds the latency of one frame, adjusting the intervals when it is due.
+
+        :param seconds: Time from the frame's arrival at the server to its result.
+        :param player: The player the frame came from, None counts it for the node only.
+        """
+        self.node.record(seconds)
+        if player is not None:
+            if player not in self.players:
+                self.players[player] = Rate(self.node.interval)
+            self.players[player].record(seconds)
+        if time.monotonic() - self._adjusted >= self.adjust_every:
+            self.adjust()
+
+    def remove_player(self, player: Hashable) -> None:
+        self.players.pop(player, None)
+
+    def _step(self, rate: Rate, depth: int) -> None:
+        if rate.latency > self.target_latency or depth > self.max_queue:
+            rate.interval = min(self.max_interval, rate.interval * 1.5)
+        elif rate.latency < self.target_latency / 2 and depth <= self.max_queue / 2:
+            rate.interval = max(self.base_interval, rate.interval * 0.9)
+
+    def adjust(self) -> None:
+        """Moves every interval one step according to the current latencies and queue depth."""
+        self._adjusted = time.monotonic()
+        depth = self.queue_depth()
+        self._step(self.node, depth)
+        for rate in self.players.values():
+            self._step(rate, depth)
+
+        if not self.degraded and self.interval >= self.base_interval * self.degrade_factor:
+            self.degraded = True
+            print(f"[load] Saturated (frame latency {self.latency * 1000:.0f} ms, {depth} crops queued), "
+                  f"degraded mode at {self.interval:.2f} s per frame")
+        elif self.degraded and self.interval <= self.base_interval:
+            self.degraded = False
+            print("[load] Caught up, leaving degraded mode")
+
+    def control(self, player: Optional[Hashable] = None, min_interval: Optional[float] = None) -> dict:
+        """
+        The control message for a client.
+
+        :param player: The client's player, None for the node's interval alone.
+        :param min_interval: The slowest rate this client must use anyway, in seconds
+            between frames (e.g. the lobby's detection frequency).
+        :return: ``interval_ms``, ``degraded``, and the ``max_width`` and ``jpeg_quality`` of frames to send.
+        :rtype: dict
+        """
+        rate = self.players.get(player)
+        interval = max(self.interval, rate.interval if rate else 0, min_interval or 0)
+        return {
+            'interval_ms': int(round(interval * 1000)),
+            'degraded': self.degraded,
+            'max_width': DEGRADED_FRAME_WIDTH if self.degraded else FRAME_WIDTH,
+            'jpeg_quality': DEGRADED_JPEG_QUALITY if self.degraded else JPEG_QUALITY,
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            'interval_ms': int(round(self.interval * 1000)),
+            'degraded': self.degraded,
+            'latency_ms': round(self.latency * 1000, 1),
+            'queue_depth': self.queue_depth(),
+            'frames': self.frames,
+            'players': len(self.players),
+            'slowed_players': sum(rate.interval > self.interval for rate in self.players.values()),
+        }
@@ -0,0 +1,553 @@
+"""
+Load test of app.py with simulated players.
+
+Usage (from the repository root):
+
+    python -m newBackend.loadtest --players 40 --lobby-size 4 --fps 5 --duration 30
+
+Starts ``serve.py`` on a local port (or targets a running server with
+``--url``), connects ``--players`` python-socketio clients, groups them into
+lobbies of ``--lobby-size`` (createGame, joinLobby, startGame, like the
+frontend) and has every player stream JPEG frames to ``webcam_data`` at
+``--fps``. Frames carry a ``capturedAt`` time that the server echoes in its
+``webcam_response``, so each response is matched to its frame. The report
+covers the frames sent during ``--duration`` (after ``--warmup``):
+
+- ``webcam_response`` latency percentiles, from sending a frame to its response,
+- dropped frames, sent but never answered (the server keeps only the newest
+  frame per player, see newBackend/frame_slot.py, and skips late ones),
+- server CPU, of the server process and all its children (forked workers,
+  inference processes), from /proc, as a share of one core,
+- the server's stats from GET /stats: load control, frame slots, frame gate,
+  sampler, result cache, inference batches and the inference pool's counters
+  (with several workers, those of the one worker the request reaches).
+
+A run fails (exit status 1) when the server answered frames without results:
+no frame answered at all, or as many frames failed in the pipeline as were
+processed (e.g. a missing model or a broken inference pool).
+
+Frames are synthetic by default: a drawn face that moves a little, with fresh
+noise in every frame. The face detector finds the drawn face in every frame,
+so detection and the model run on each frame the frame gate and the sampler
+let through (their reuse shows in the report). Pass ``--images`` with a
+directory of real face photos to stream those instead, fitted into the frame
+without distorting them. Server options go
+through the usual ``KRACKLE_*`` environment variables, plus ``--workers`` for
+serve.py (several workers run lobby-sharded). ``--json`` writes the results
+for comparing runs. Everything runs on this machine (Linux, for /proc), over loopback.
+
+The asyncio python-socketio client needs ``aiohttp``.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Optional
+
+import cv2
+import numpy as np
+import socketio
+
+from newBackend.frame_decode import image_files
+
+# GET /stats sections included in the report
+SERVER_STATS = ('load', 'frame_slot', 'frame_gate', 'sampler', 'result_cache', 'batcher', 'inference')
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def process_tree(pid: int) -> list[int]:
+    """A process and all its descendants, from /proc."""
+    children: dict[int, list[int]] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name is in parentheses and may contain spaces, the parent pid follows the state
+        ppid = int(stat[stat.rfind(')') + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        pending.extend(children.get(current, []))
+    return pids
+
+
+def cpu_seconds(pid: int) -> float:
+    """User + system CPU time of a process and its descendants (living, or exited and waited for)."""
+    total = 0
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        # utime, stime, cutime, cstime
+        total += sum(int(v) for v in fields[11:15])
+    return total / CLOCK_TICKS
+
+
+class CpuSampler:
+    """Samples a process tree's CPU use every ``interval`` seconds while running."""
+
+    def __init__(self, pid: int, interval: float = 1.0):
+        self.pid = pid
+        self.interval = interval
+        self.samples: list[float] = []
+        self._start = (0.0, 0.0)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._start = (time.monotonic(), cpu_seconds(self.pid))
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        last = self._start
+        while True:
+            await asyncio.sleep(self.interval)
+            now = (time.monotonic(), cpu_seconds(self.pid))
+            self.samples.append((now[1] - last[1]) / (now[0] - last[0]))
+            last = now
+
+    def stop(self) -> dict:
+        """
+        Ends sampling.
+
+        :return: ``mean`` and ``peak`` CPU use over the sampled time, in cores (1.0 is one busy core).
+        :rtype: dict
+        """
+        self._task.cancel()
+        elapsed = time.monotonic() - self._start[0]
+        mean = (cpu_seconds(self.pid) - self._start[1]) / elapsed if elapsed > 0 else 0.0
+        return {'mean': mean, 'peak': max(self.samples, default=mean)}
+
+
+def synthetic_frames(count: int, width: int, height: int, seed: int) -> list[np.ndarray]:
+    """Frames of a drawn face drifting around the middle of the picture, each with its own noise."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(count):
+        frame = np.full((height, width, 3), 90, np.uint8)
+        cx = int(width / 2 + width / 20 * np.sin(2 * np.pi * i / count))
+        cy = int(height / 2 + height / 30 * np.cos(2 * np.pi * i / count))
+        size = min(width, height) // 4
+        cv2.ellipse(frame, (cx, cy), (size, int(size * 1.3)), 0, 0, 360, (170, 190, 215), -1)
+        for side in (-1, 1):
+            cv2.circle(frame, (cx + side * size // 2, cy - size // 3), size // 8, (40, 40, 40), -1)
+        mouth = size // 6 + int(size // 6 * abs(np.sin(4 * np.pi * i / count)))
+        cv2.ellipse(frame, (cx, cy + size // 2), (size // 2, mouth), 0, 0, 180, (60, 40, 120), -1)
+        frames.append(frame)
+    return [np.clip(frame + rng.normal(0, 6, frame.shape), 0, 255).astype(np.uint8) for frame in frames]
+
+
+def fit_frame(image: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Scales an image into a width x height frame keeping its aspect ratio, the edges fill the rest."""
+    scale = min(width / image.shape[1], height / image.shape[0])
+    image = cv2.resize(image, (max(round(image.shape[1] * scale), 1), max(round(image.shape[0] * scale), 1)),
+                       interpolation=cv2.INTER_AREA)
+    top, left = (height - image.shape[0]) // 2, (width - image.shape[1]) // 2
+    return cv2.copyMakeBorder(image, top, height - image.shape[0] - top, left, width - image.shape[1] - left,
+                              cv2.BORDER_REPLICATE)
+
+
+def image_frames(directory: str, count: int, width: int, height: int, seed: int) -> list[np.ndarray]:
+    """Frames made from the photos of a directory, shifted a little and with noise, like a webcam."""
+    rng = np.random.default_rng(seed)
+    photos = []
+    for path in image_files(directory):
+        image = cv2.imread(path)
+        if image is not None:
+            # A squashed face is no face to the detector
+            photos.append(fit_frame(image, width, height))
+    if not photos:
+        raise FileNotFoundError(f"No images in {directory}")
+
+    frames = []
+    for i in range(count):
+        dx, dy = rng.integers(-width // 40, width // 40 + 1), rng.integers(-height // 40, height // 40 + 1)
+        shift = np.float32([[1, 0, dx], [0, 1, dy]])
+        frame = cv2.warpAffine(photos[i % len(photos)], shift, (width, height), borderMode=cv2.BORDER_REPLICATE)
+        frames.append(np.clip(frame + rng.normal(0, 4, frame.shape), 0, 255).astype(np.uint8))
+    return frames
+
+
+def encode_frames(frames: list[np.ndarray], quality: int) -> list[bytes]:
+    return [cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes() for frame in frames]
+
+
+class Player:
+    """
+    One simulated player: a Socket.IO connection streaming frames once its game started.
+
+    :param index: The player's number, also gives it its own client address.
+    :param url: The server's URL.
+    :param frames: Encoded JPEG frames, streamed in a loop starting at the player's own offset.
+    :param base64_frames: Send frames as data URLs in ``image`` instead of binary ``bytes``.
+    """
+
+    def __init__(self, index: int, url: str, frames: list[bytes], base64_frames: bool = False):
+        self.index = index
+        self.name = f'player-{index}'
+        self.url = url
+        self.frames = frames
+        self.base64_frames = base64_frames
+        self.lobby_code: Optional[str] = None
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.interval: Optional[float] = None
+
+        # capturedAt (ms) -> whether the frame counts, for frames waiting for their response
+        self.pending: dict[float, bool] = {}
+        self.latencies: list[float] = []
+        self.sent = 0
+        self.answered = 0
+        self.unmatched = 0
+        self.round_lost = 0
+        self.late_sends = 0
+        self.measuring = False
+
+        self._replies: dict[str, asyncio.Future] = {}
+        self.sio.on('createGameResponse', self._reply_handler('createGameResponse'))
+        self.sio.on('joinLobbyResponse', self._reply_handler('joinLobbyResponse'))
+        self.sio.on('gameStarted', self._reply_handler('gameStarted'))
+        self.sio.on('webcam_response', self.on_webcam_response)
+        self.sio.on('capture_control', self.on_capture_control)
+
+    def _reply_handler(self, event: str):
+        async def handler(data=None):
+            future = self._replies.get(event)
+            if future is not None and not future.done():
+                future.set_result(data)
+        return handler
+
+    async def request(self, event: str, data, reply: str, timeout: float = 10.0):
+        """Emits an event and waits for the reply event."""
+        future = self._replies[reply] = asyncio.get_running_loop().create_future()
+        await self.sio.emit(event, data)
+        return await asyncio.wait_for(future, timeout)
+
+    async def connect(self, lobby_code: Optional[str] = None) -> None:
+        # With several workers joining players are routed by lobby code, the rest by client address:
+        # a fake one per player spreads the lobbies over the workers like real clients
+        url = f'{self.url}?lobbyCode={lobby_code}' if lobby_code else self.url
+        headers = {'X-Forwarded-For': f'10.{self.index >> 16 & 255}.{self.index >> 8 & 255}.{self.index & 255}'}
+        await self.sio.connect(url, headers=headers, transports=['websocket'])
+
+    async def create_game(self, lobby_size: int) -> str:
+        await self.connect()
+        response = await self.request('createGame', {'adminName': self.name, 'timer': 60, 'rounds': 1,
+                                                     'players': lobby_size}, 'createGameResponse')
+        self.lobby_code = response['gameId']
+        return self.lobby_code
+
+    async def join(self, lobby_code: str) -> None:
+        await self.connect(lobby_code)
+        response = await self.request('joinLobby', {'lobbyCode': lobby_code, 'playerName': self.name},
+                                      'joinLobbyResponse')
+        if not response.get('success'):
+            raise RuntimeError(f"{self.name} could not join {lobby_code}: {response.get('message')}")
+        self.lobby_code = lobby_code
+
+    async def start_game(self) -> None:
+        await self.request('startGame', self.lobby_code, 'gameStarted')
+
+    def expect_start(self) -> asyncio.Future:
+        future = self._replies['gameStarted'] = asyncio.get_running_loop().create_future()
+        return future
+
+    async def on_webcam_response(self, data=None) -> None:
+        captured_at = (data or {}).get('capturedAt')
+        counted = self.pending.pop(captured_at, None)
+        if counted is None:
+            self.unmatched += 1
+            return
+        if counted:
+            self.answered += 1
+            self.latencies.append(time.time() * 1000 - captured_at)
+        if data.get('message') == 'roundLost':
+            self.round_lost += 1
+
+    async def on_capture_control(self, data=None) -> None:
+        if data and data.get('interval_ms'):
+            self.interval = data['interval_ms'] / 1000
+
+    async def stream(self, fps: float, until: float, follow_control: bool = False) -> None:
+        """Sends frames every 1 / fps seconds until time.monotonic() reaches ``until``."""
+        interval = 1 / fps
+        next_send = time.monotonic() + interval * (self.index % 10) / 10
+        frame = self.index
+        while True:
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif -delay > interval:
+                # The load generator itself can't keep up
+                self.late_sends += 1
+                next_send = time.monotonic()
+            if next_send >= until or not self.sio.connected:
+                return
+
+            captured_at = time.time() * 1000
+            while captured_at in self.pending:
+                captured_at += 0.001
+            self.pending[captured_at] = self.measuring
+            if self.measuring:
+                self.sent += 1
+            data = self.frames[frame % len(self.frames)]
+            if self.base64_frames:
+                payload = {'image': 'data:image/jpeg;base64,' + base64.b64encode(data).decode()}
+            else:
+                payload = {'bytes': data}
+            payload.update(lobbyCode=self.lobby_code, capturedAt=captured_at)
+            try:
+                await self.sio.emit('webcam_data', payload)
+            except socketio.exceptions.BadNamespaceError:
+                return
+            frame += 1
+            next_send += self.interval if follow_control and self.interval else interval
+
+    def dropped(self) -> int:
+        return sum(self.pending.values())
+
+
+async def start_lobby(players: list[Player]) -> None:
+    """Creates a game with the first player, has the others join it, and starts it."""
+    admin, others = players[0], players[1:]
+    lobby_code = await admin.create_game(len(players))
+    for player in others:
+        await player.join(lobby_code)
+    started = [player.expect_start() for player in others]
+    await admin.start_game()
+    await asyncio.wait_for(asyncio.gather(*started), 10)
+
+
+def fetch_stats(url: str) -> Optional[dict]:
+    try:
+        with urllib.request.urlopen(f'{url}/stats', timeout=5) as response:
+            return json.loads(response.read())
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, args: argparse.Namespace) -> subprocess.Popen:
+    """Starts serve.py on a loopback port and waits until it answers."""
+    command = [sys.executable, os.path.join(REPO_ROOT, 'serve.py'), '--host', '127.0.0.1', '--port', str(port),
+               '--workers', str(args.workers), '--log-level', 'warning']
+    log = open(args.server_log, 'ab') if args.server_log else subprocess.DEVNULL
+    server = subprocess.Popen(command, cwd=REPO_ROOT, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.monotonic() + args.startup_timeout
+    while fetch_stats(f'http://127.0.0.1:{port}') is None:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py exited with status {server.returncode}"
+                               + ("" if args.server_log else ", pass --server-log to see why"))
+        if time.monotonic() > deadline:
+            stop_server(server)
+            raise RuntimeError(f"serve.py didn't answer within {args.startup_timeout} s")
+        time.sleep(0.5)
+    return server
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(15)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def percentiles(latencies: list[float]) -> dict:
+    if not latencies:
+        return {}
+    values = np.percentile(latencies, [50, 95, 99])
+    return {'p50': float(values[0]), 'p95': float(values[1]), 'p99': float(values[2]),
+            'max': float(max(latencies)), 'mean': float(np.mean(latencies))}
+
+
+async def run(url: str, server_pid: Optional[int], frames: list[bytes], args: argparse.Namespace) -> dict:
+    players = [Player(i, url, frames, args.base64) for i in range(args.players)]
+    lobbies = [players[i:i + args.lobby_size] for i in range(0, len(players), args.lobby_size)]
+
+    start = time.monotonic()
+    # Lobbies are set up a few at a time, like players arriving rather than all in the same millisecond
+    limit = asyncio.Semaphore(args.setup_concurrency)
+
+    async def setup(lobby: list[Player]) -> None:
+        async with limit:
+            await start_lobby(lobby)
+
+    try:
+        await asyncio.gather(*(setup(lobby) for lobby in lobbies))
+    except Exception:
+        # Close the connections while the loop still runs, their tasks would fail with it otherwise
+        await asyncio.gather(*(player.sio.disconnect() for player in players), return_exceptions=True)
+        raise
+    print(f"{len(lobbies)} lobbies of up to {args.lobby_size} players started in {time.monotonic() - start:.1f} s")
+
+    stream_start = time.monotonic()
+    measure_start = stream_start + args.warmup
+    stream_end = measure_start + args.duration
+    streams = [asyncio.create_task(player.stream(args.fps, stream_end, args.follow_control)) for player in players]
+
+    await asyncio.sleep(max(measure_start - time.monotonic(), 0))
+    for player in players:
+        player.measuring = True
+    sampler = CpuSampler(server_pid) if server_pid else None
+    if sampler:
+        sampler.start()
+    print(f"Measuring {args.duration:.0f} s at {args.fps:g} fps per player...")
+    await asyncio.gather(*streams)
+    cpu = sampler.stop() if sampler else None
+
+    # Responses of the last frames still on their way
+    await asyncio.sleep(args.drain)
+    stats = fetch_stats(url)
+    await asyncio.gather(*(player.sio.disconnect() for player in players), return_exceptions=True)
+
+    latencies = [latency for player in players for latency in player.latencies]
+    sent = sum(player.sent for player in players)
+    dropped = sum(player.dropped() for player in players)
+    return {
+        'players': len(players),
+        'lobbies': len(lobbies),
+        'fps': args.fps,
+        'duration': args.duration,
+        'frame_bytes': int(np.mean([len(frame) for frame in frames])),
+        'sent': sent,
+        'answered': sum(player.answered for player in players),
+        'dropped': dropped,
+        'drop_rate': dropped / sent if sent else 0.0,
+        'late_sends': sum(player.late_sends for player in players),
+        'unmatched': sum(player.unmatched for player in players),
+        'round_lost': sum(player.round_lost for player in players),
+        'latency_ms': percentiles(latencies),
+        'server_cpu': cpu,
+        'server_stats': {key: stats[key] for key in SERVER_STATS if key in stats} if stats else None,
+    }
+
+
+def failure(results: dict) -> Optional[str]:
+    """
+    Checks whether the server really worked on the frames.
+
+    :param results: What ``run`` returned.
+    :return: Why the run failed, None when it didn't.
+    :rtype: Optional[str]
+    """
+    if results['sent'] and not results['answered']:
+        return f"none of the {results['sent']} frames sent was answered"
+    server_stats = results['server_stats'] or {}
+    errors = server_stats.get('inference', {}).get('frame_errors', 0)
+    processed = server_stats.get('frame_slot', {}).get('processed', 0)
+    if errors and errors >= processed:
+        restarts = server_stats['inference'].get('pool_restarts', 0)
+        return (f"all {processed} frames the server processed failed ({errors} errors, {restarts} inference pool"
+                f" restarts), check the model and the server log")
+    return None
+
+
+def print_report(results: dict) -> None:
+    print(f"Players: {results['players']} in {results['lobbies']} lobbies, {results['fps']:g} fps each,"
+          f" {results['frame_bytes'] / 1024:.1f} KiB frames")
+    print(f"Frames: {results['sent']} sent, {results['answered']} answered,"
+          f" {results['dropped']} dropped ({100 * results['drop_rate']:.1f}%)")
+    latency = results['latency_ms']
+    if latency:
+        print(f"Latency: p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, p99 {latency['p99']:.1f} ms,"
+              f" max {latency['max']:.1f} ms")
+    if results['unmatched']:
+        print(f"Responses without a known capturedAt: {results['unmatched']} (server too old to echo it?)")
+    if results['late_sends']:
+        print(f"Frames the load generator sent late: {results['late_sends']}, its numbers understate the load")
+    cpu = results['server_cpu']
+    if cpu:
+        print(f"Server CPU: mean {100 * cpu['mean']:.0f}%, peak {100 * cpu['peak']:.0f}% of one core"
+              f" ({os.cpu_count()} cores)")
+    if results['server_stats']:
+        for key, value in results['server_stats'].items():
+            print(f"Server {key}: {value}")
+        restarts = results['server_stats'].get('inference', {}).get('pool_restarts', 0)
+        if restarts:
+            print(f"The server's inference pool broke and was restarted {restarts} time(s)")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Load test of app.py with simulated players")
+    ap.add_argument("--players", type=int, default=20)
+    ap.add_argument("--lobby-size", type=int, default=4, help="players per lobby, the first one creates it")
+    ap.add_argument("--fps", type=float, default=2.0, help="frames each player sends per second")
+    ap.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    ap.add_argument("--warmup", type=float, default=5.0, help="seconds streamed before measuring")
+    ap.add_argument("--drain", type=float, default=2.0, help="seconds to wait for the last responses")
+    ap.add_argument("--images", help="directory of face photos to stream instead of synthetic frames")
+    ap.add_argument("--width", type=int, default=320)
+    ap.add_argument("--height", type=int, default=240)
+    ap.add_argument("--quality", type=int, default=80, help="JPEG quality of the frames")
+    ap.add_argument("--base64", action="store_true", help="send frames as data URLs instead of binary")
+    ap.add_argument("--follow-control", action="store_true",
+                    help="slow down when the server's capture_control asks to, instead of a fixed rate")
+    ap.add_argument("--setup-concurrency", type=int, default=8, help="lobbies set up at the same time")
+    ap.add_argument("--url", help="test a running server instead of starting one")
+    ap.add_argument("--server-pid", type=int, help="pid of the server given with --url, for its CPU use")
+    ap.add_argument("--workers", type=int, default=1, help="serve.py workers")
+    ap.add_argument("--server-log", help="append the started server's output to this file")
+    ap.add_argument("--startup-timeout", type=float, default=120.0)
+    ap.add_argument("--json", help="also write the results to this file")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    count = max(4 * args.fps, 10)
+    if args.images:
+        frames = image_frames(args.images, int(count), args.width, args.height, args.seed)
+    else:
+        frames = synthetic_frames(int(count), args.width, args.height, args.seed)
+    frames = encode_frames(frames, args.quality)
+
+    server = None
+    if args.url:
+        url, server_pid = args.url.rstrip('/'), args.server_pid
+    else:
+        port = free_port()
+        print(f"Starting serve.py with {args.workers} worker(s) on port {port}...")
+        server = start_server(port, args)
+        url, server_pid = f'http://127.0.0.1:{port}', server.pid
+
+    try:
+        results = asyncio.run(run(url, server_pid, frames, args))
+    finally:
+        if server:
+            stop_server(server)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    reason = failure(results)
+    if reason:
+        sys.exit(f"Load test failed: {reason}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+Assigns lobbies to server processes by their code.
+
+With several workers (``serve.py --workers N``, always lobby-sharded) every worker process owns
+the lobbies whose code hashes to its index, so a lobby's state lives in one
+process and is never locked or shared. Codes are hashed with CRC-32, which is
+the same in every process (``hash()`` of a str is salted per process). A
+worker creating a lobby draws codes until one hashes to itself, about as many
+draws as there are workers.
+"""
+import secrets
+import zlib
+from typing import Container
+
+
+def lobby_shard(lobby_code: str, shards: int) -> int:
+    """The index of the worker that owns a lobby, out of ``shards`` workers."""
+    return zlib.crc32(lobby_code.encode()) % shards
+
+
+def new_lobby_code(shard: int = 0, shards: int = 1, taken: Container[str] = ()) -> str:
+    """
+    Draws a new lobby code that belongs to a worker.
+
+    :param shard: The index of the worker creating the lobby.
+    :param shards: The number of workers.
+    :param taken: Codes already in use.
+    :return: An 8 hex digit code, not in ``taken``, with ``lobby_shard(code, shards) == shard``.
+    :rtype: str
+    """
+    while True:
+        code = secrets.token_hex(4)
+        if code not in taken and lobby_shard(code, shards) == shard:
+            return code
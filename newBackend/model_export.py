@@ -0,0 +1,174 @@
+"""
+Exports the emotion model to int8 TFLite, and checks it (or the NumPy engine) against the Keras model.
+
+Usage (from the repository root):
+
+    python -m newBackend.model_export export path/to/faces --out newBackend/model_int8.tflite
+    python -m newBackend.model_export parity path/to/faces --tflite newBackend/model_int8.tflite
+    python -m newBackend.model_export parity path/to/faces --backend numpy
+
+The sample directory holds face images: small ones (FER2013-style 48x48 crops)
+are used as they are, larger ones go through the Haar detector first. ``export``
+calibrates the int8 ranges on them, so they should look like what players send.
+``parity`` compares the Keras model with the other backend on them: probability drift, top-1 agreement,
+how often the Happy + Surprised score lands on the other side of app.py's 0.8
+threshold, and the latency per crop at batch size 1 and 32.
+"""
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from newBackend.face_detection import create_detector
+from newBackend.frame_decode import image_files
+from newBackend.inference_pool import crop_face
+from newBackend.model_registry import MODEL_PATH, get_model
+from newBackend.numpy_model import NumpyEmotionModel
+from newBackend.tflite_model import TFLITE_MODEL_PATH, TFLiteEmotionModel
+
+# Images this small are already face crops
+CROP_MAX_SIDE = 96
+
+# emotion_dict indices of the emotions that count as laughing, and the app.py threshold
+LAUGH_INDICES = (3, 6)
+LAUGH_THRESHOLD = 0.8
+
+
+def load_samples(directory: str, limit: int = 500) -> np.ndarray:
+    """
+    Collects face crops from a directory of images.
+
+    :param directory: Face crops, or photos to run the face detector on.
+    :param limit: Stop after this many crops.
+    :return: An (N, 48, 48, 1) uint8 array.
+    :rtype: np.ndarray
+    """
+    detector = None
+    crops = []
+    for path in image_files(directory):
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            continue
+
+        if max(gray.shape) <= CROP_MAX_SIDE:
+            crops.append(crop_face(gray, (0, 0, gray.shape[1], gray.shape[0])))
+        else:
+            detector = detector or create_detector('haar')
+            crops.extend(crop_face(gray, box) for box in detector.detect(gray))
+        if len(crops) >= limit:
+            break
+
+    if not crops:
+        raise SystemExit(f"No face crops found in {directory}")
+    return np.stack(crops[:limit])
+
+
+def export_tflite(model, samples: np.ndarray, out_path: str, int8_io: bool = False) -> int:
+    """
+    Converts the Keras model to TFLite with int8 weights and activations.
+
+    :param model: The Keras emotion model, weights loaded.
+    :param samples: Face crops the activation ranges are calibrated on.
+    :param out_path: Where the .tflite file is written.
+    :param int8_io: Also make the input and output int8 (TFLiteEmotionModel handles both).
+    :return: The size of the written file, in bytes.
+    :rtype: int
+    """
+    import tensorflow as tf
+    from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+    # A concrete function with a free batch dimension, so the interpreter can be resized to any batch.
+    # The calibrator can't read keras_core's resource variables, so the weights are frozen into constants.
+    forward = tf.function(lambda x: model(x, training=False), autograph=False)
+    concrete = forward.get_concrete_function(tf.TensorSpec([None, 48, 48, 1], tf.float32))
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([convert_variables_to_constants_v2(concrete)])
+
+    def representative_dataset():
+        for crop in samples:
+            yield [crop[np.newaxis].astype(np.float32)]
+
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    if int8_io:
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+
+    data = converter.convert()
+    with open(out_path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+def time_per_crop(predict, samples: np.ndarray, batch_size: int, repeat: int) -> float:
+    """Mean milliseconds per crop when predicting ``samples`` in batches of ``batch_size``."""
+    batches = [samples[i:i + batch_size] for i in range(0, len(samples), batch_size)]
+    predict(batches[0])
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for batch in batches:
+            predict(batch)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(samples))
+
+
+def parity(keras_model, other_model, samples: np.ndarray, repeat: int = 3, name: str = 'tflite') -> None:
+    """Prints how far the probabilities of another backend drift from the Keras ones, and how fast both are."""
+    expected = keras_model.predict(samples, verbose=0)
+    actual = other_model.predict(samples)
+    drift = np.abs(actual - expected)
+
+    laugh_expected = expected[:, LAUGH_INDICES].sum(axis=1)
+    laugh_actual = actual[:, LAUGH_INDICES].sum(axis=1)
+    flipped = np.count_nonzero((laugh_expected > LAUGH_THRESHOLD) != (laugh_actual > LAUGH_THRESHOLD))
+
+    print(f"Samples: {len(samples)}")
+    print(f"Probability drift: max {drift.max():.4f}, mean {drift.mean():.4f}, p99 {np.percentile(drift, 99):.4f}")
+    print(f"Top-1 agreement: {np.mean(expected.argmax(axis=1) == actual.argmax(axis=1)):.2%}")
+    print(f"Happy + Surprised drift: max {np.abs(laugh_actual - laugh_expected).max():.4f},"
+          f" crossed the {LAUGH_THRESHOLD} threshold the other way on {flipped} samples")
+
+    for batch_size in (1, 32):
+        keras_ms = time_per_crop(lambda x: keras_model.predict(x, verbose=0), samples, batch_size, repeat)
+        other_ms = time_per_crop(other_model.predict, samples, batch_size, repeat)
+        print(f"Batch {batch_size:>2}: keras {keras_ms:7.3f} ms/crop, {name} {other_ms:7.3f} ms/crop"
+              f" ({keras_ms / other_ms:4.1f}x)")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="int8 TFLite export of the emotion model, and a parity check")
+    commands = ap.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="convert model.h5 to int8 TFLite")
+    export.add_argument("samples", help="directory of face images to calibrate on")
+    export.add_argument("--model", default=MODEL_PATH, help="Keras weights")
+    export.add_argument("--out", default=TFLITE_MODEL_PATH)
+    export.add_argument("--int8-io", action="store_true", help="int8 input and output tensors as well")
+    export.add_argument("--limit", type=int, default=500, help="calibration crops used")
+
+    check = commands.add_parser("parity", help="compare the TFLite model or the NumPy engine to Keras")
+    check.add_argument("samples", help="directory of face images to compare on")
+    check.add_argument("--model", default=MODEL_PATH, help="Keras weights")
+    check.add_argument("--backend", choices=("tflite", "numpy"), default="tflite")
+    check.add_argument("--tflite", default=TFLITE_MODEL_PATH)
+    check.add_argument("--limit", type=int, default=500, help="crops compared")
+    check.add_argument("--repeat", type=int, default=3, help="timed runs over the samples")
+    args = ap.parse_args()
+
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    samples = load_samples(args.samples, args.limit)
+    keras_model = get_model('keras', args.model)
+    if args.command == "export":
+        size = export_tflite(keras_model, samples, args.out, args.int8_io)
+        print(f"Wrote {args.out} ({size / 1024:.0f} KiB, {os.path.getsize(args.model) / 1024:.0f} KiB as .h5),"
+              f" calibrated on {len(samples)} crops")
+        args.tflite = args.out
+    if getattr(args, 'backend', 'tflite') == 'numpy':
+        parity(keras_model, NumpyEmotionModel(args.model), samples, args.repeat, 'numpy')
+    else:
+        parity(keras_model, TFLiteEmotionModel(args.tflite), samples, getattr(args, 'repeat', 3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+The one place the emotion model and the Haar cascade are built and loaded.
+
+Both are loaded lazily, on first use, and cached per process (keyed by backend
+and path), so importing a module that predicts (app.py, api.consumers) doesn't
+pull in TensorFlow and every process reads the weights exactly once.
+``warm_up`` loads them ahead of time and runs a forward pass, and ``timings``
+holds how long each step took (``report`` formats them).
+
+Backends, picked with KRACKLE_EMOTION_BACKEND:
+
+- ``keras``: the Sequential model through keras_core / TensorFlow, called
+  through pre-traced graphs per batch bucket (keras_model.py).
+- ``numpy``: the same weights run by numpy_model.py, without TensorFlow.
+- ``tflite``: the int8 export written by model_export.py.
+"""
+import os
+import threading
+import time
+from typing import Any, Optional
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, 'model.h5')
+CASCADE_PATH = os.path.join(BASE_DIR, 'haarcascade_frontalface_default.xml')
+
+BACKENDS = ('keras', 'numpy', 'tflite')
+DEFAULT_BACKEND = os.environ.get('KRACKLE_EMOTION_BACKEND', 'keras')
+
+# Seconds spent per step, e.g. {'keras import': 2.1, 'keras load': 0.3, 'keras trace': 0.5, 'keras warm-up': 0.4}
+timings: dict[str, float] = {}
+
+_models: dict[tuple, Any] = {}
+_cascades: dict[str, Any] = {}
+# Requests handled in executor threads may ask for the model at the same time, it is loaded once
+_lock = threading.RLock()
+
+
+def build_keras_model():
+    """Builds the 7-class emotion CNN (no weights loaded)."""
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    start = time.perf_counter()
+    from keras_core.models import Sequential
+    from keras_core.layers import Dense, Dropout, Flatten
+    from keras_core.layers import Conv2D, MaxPooling2D
+    timings.setdefault('keras import', time.perf_counter() - start)
+
+    model = Sequential()
+
+    # Add layers
+    model.add(Conv2D(32, kernel_size=(3, 3), activation='relu', input_shape=(48, 48, 1)))
+    model.add(Conv2D(64, kernel_size=(3, 3), activation='relu'))
+    model.add(MaxPooling2D(pool_size=(2, 2)))
+    model.add(Dropout(0.25))
+
+    model.add(Conv2D(128, kernel_size=(3, 3), activation='relu'))
+    model.add(MaxPooling2D(pool_size=(2, 2)))
+    model.add(Conv2D(128, kernel_size=(3, 3), activation='relu'))
+    model.add(MaxPooling2D(pool_size=(2, 2)))
+    model.add(Dropout(0.25))
+
+    model.add(Flatten())
+    model.add(Dense(1024, activation='relu'))
+    model.add(Dropout(0.5))
+    model.add(Dense(7, activation='softmax'))
+    return model
+
+
+def _load(backend: str, path: str, options: dict) -> Any:
+    if backend == 'tflite':
+        from newBackend.tflite_model import TFLiteEmotionModel as model_class
+    elif backend == 'numpy':
+        from newBackend.numpy_model import NumpyEmotionModel as model_class
+    else:
+        from newBackend.keras_model import CompiledKerasModel
+
+        model = build_keras_model()
+        start = time.perf_counter()
+        model.load_weights(path)
+        timings['keras load'] = time.perf_counter() - start
+        start = time.perf_counter()
+        model = CompiledKerasModel(model, **options)
+        timings['keras trace'] = time.perf_counter() - start
+        return model
+
+    start = time.perf_counter()
+    model = model_class(path, **options)
+    timings[f'{backend} load'] = time.perf_counter() - start
+    return model
+
+
+def get_model(backend: Optional[str] = None, path: Optional[str] = None, **options: Any) -> Any:
+    """
+    Returns this process's emotion model, loading it on the first call.
+
+    :param backend: ``keras``, ``numpy`` or ``tflite``, defaults to KRACKLE_EMOTION_BACKEND.
+    :param path: The weights (or .tflite) file, defaults to the one in newBackend.
+    :param options: Passed to the CompiledKerasModel / NumpyEmotionModel / TFLiteEmotionModel constructor.
+    :return: A model with a Keras-style ``predict(crops, verbose=0)``.
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown emotion backend '{backend}', expected one of: {', '.join(BACKENDS)}")
+    if path is None:
+        from newBackend.tflite_model import TFLITE_MODEL_PATH
+        path = TFLITE_MODEL_PATH if backend == 'tflite' else MODEL_PATH
+    key = (backend, os.path.abspath(path), tuple(sorted(options.items())))
+
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _lock:
+        if key not in _models:
+            _models[key] = _load(backend, path, options)
+            print(f"[AI] Loaded the {backend} emotion model from {path} ({report()})")
+        return _models[key]
+
+
+def get_cascade(path: str = CASCADE_PATH):
+    """Returns this process's Haar cascade for ``path``, loading it on the first call."""
+    cascade = _cascades.get(path)
+    if cascade is not None:
+        return cascade
+    with _lock:
+        if path not in _cascades:
+            import cv2
+
+            start = time.perf_counter()
+            cascade = cv2.CascadeClassifier(path)
+            if cascade.empty():
+                raise FileNotFoundError(f"Could not load Haar cascade: {path}")
+            _cascades[path] = cascade
+            timings['cascade load'] = time.perf_counter() - start
+        return _cascades[path]
+
+
+def warm_up(backend: Optional[str] = None, path: Optional[str] = None,
+            batch_sizes: Optional[tuple[int, ...]] = None, **options: Any) -> Any:
+    """
+    Loads the model and runs a forward pass per batch size, so the first real request doesn't pay for it.
+
+    :param batch_sizes: Defaults to every bucket of the keras backend, a single crop otherwise.
+    :return: The loaded model.
+    """
+    model = get_model(backend, path, **options)
+    batch_sizes = batch_sizes or getattr(model, 'buckets', (1,))
+    start = time.perf_counter()
+    for batch_size in batch_sizes:
+        model.predict(np.zeros((batch_size, 48, 48, 1), np.uint8), verbose=0)
+    timings[f'{backend or DEFAULT_BACKEND} warm-up'] = time.perf_counter() - start
+    return model
+
+
+def report() -> str:
+    """The timings so far, e.g. ``keras import 2.10 s, keras load 0.31 s``."""
+    return ', '.join(f'{step} {seconds:.2f} s' for step, seconds in timings.items())
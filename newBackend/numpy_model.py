@@ -0,0 +1,123 @@
+"""
+The emotion CNN in plain NumPy, reading model.h5 with h5py.
+
+Four small convolutions and two dense layers don't need TensorFlow: a
+convolution is an im2col (a strided window view, copied into a matrix) times
+the kernel as one BLAS matmul. Without the Keras import a process starts in a
+fraction of a second and holds ~10 MB of weights instead of the whole runtime.
+
+The weights are found by shape, so it reads both the tf.keras ``layer_names``
+layout and the keras_core ``.weights.h5`` one.
+"""
+from typing import Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from newBackend.model_registry import MODEL_PATH
+
+# Kernel shapes of model_registry.build_keras_model, in layer order. Dropout only acts while training,
+# and the max pooling layers come after the 2nd, 3rd and 4th convolution.
+KERNEL_SHAPES = [(3, 3, 1, 32), (3, 3, 32, 64), (3, 3, 64, 128), (3, 3, 128, 128), (2048, 1024), (1024, 7)]
+POOL_AFTER = {1, 2, 3}
+
+
+def load_weights(model_path: str = MODEL_PATH) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Reads the (kernel, bias) pair of every layer from a Keras weights file.
+
+    :param model_path: The .h5 file written by ``save_weights``.
+    :return: float32 (kernel, bias) pairs, in the order of KERNEL_SHAPES.
+    :rtype: list[tuple[np.ndarray, np.ndarray]]
+    """
+    import h5py
+
+    # A layer's kernel and bias are the only datasets of their group
+    groups: dict[str, dict[int, np.ndarray]] = {}
+
+    def collect(name: str, node) -> None:
+        if isinstance(node, h5py.Dataset):
+            groups.setdefault(node.parent.name, {})[node.ndim] = node[()]
+
+    with h5py.File(model_path, 'r') as f:
+        f.visititems(collect)
+
+    by_shape = {}
+    for datasets in groups.values():
+        kernel = next((data for ndim, data in datasets.items() if ndim > 1), None)
+        if kernel is not None and 1 in datasets:
+            by_shape[kernel.shape] = (kernel, datasets[1])
+
+    missing = [shape for shape in KERNEL_SHAPES if shape not in by_shape]
+    if missing:
+        raise ValueError(f"{model_path} has no weights for the layers shaped {missing}")
+    return [tuple(np.ascontiguousarray(w, dtype=np.float32) for w in by_shape[shape]) for shape in KERNEL_SHAPES]
+
+
+def conv2d_relu(x: np.ndarray, kernel: np.ndarray, bias: np.ndarray) -> np.ndarray:
+    """A 'valid', stride 1 convolution followed by ReLU, for (N, H, W, C) input."""
+    kh, kw, channels, filters = kernel.shape
+    n, h, w, _ = x.shape
+    # (N, H', W', C, kh, kw) view, no copy yet
+    windows = sliding_window_view(x, (kh, kw), axis=(1, 2))
+    # im2col: one row per output pixel, ordered (kh, kw, C) like the kernel
+    columns = windows.transpose(0, 1, 2, 4, 5, 3).reshape(-1, kh * kw * channels)
+    out = columns @ kernel.reshape(-1, filters)
+    out += bias
+    np.maximum(out, 0, out=out)
+    return out.reshape(n, h - kh + 1, w - kw + 1, filters)
+
+
+def max_pool_2x2(x: np.ndarray) -> np.ndarray:
+    """2x2 max pooling with stride 2, an odd last row or column is dropped like Keras does."""
+    n, h, w, c = x.shape
+    x = x[:, :h // 2 * 2, :w // 2 * 2]
+    return x.reshape(n, h // 2, 2, w // 2, 2, c).max(axis=(2, 4))
+
+
+def softmax(x: np.ndarray) -> np.ndarray:
+    x = np.exp(x - x.max(axis=-1, keepdims=True))
+    return x / x.sum(axis=-1, keepdims=True)
+
+
+class NumpyEmotionModel:
+    """
+    The emotion model on NumPy alone.
+
+    :param model_path: The Keras weights file.
+    :param chunk_size: Crops run through the network at once. The im2col matrix
+        of the second convolution takes ~2 MB per crop, so big batches are split.
+    """
+
+    def __init__(self, model_path: str = MODEL_PATH, chunk_size: int = 16):
+        self.model_path = model_path
+        self.chunk_size = chunk_size
+        self.layers = load_weights(model_path)
+
+    def _forward(self, x: np.ndarray) -> np.ndarray:
+        for i, (kernel, bias) in enumerate(self.layers[:4]):
+            x = conv2d_relu(x, kernel, bias)
+            if i in POOL_AFTER:
+                x = max_pool_2x2(x)
+
+        # Flatten in (H, W, C) order, same as Keras with channels_last
+        x = x.reshape(len(x), -1)
+        (kernel, bias), (out_kernel, out_bias) = self.layers[4:]
+        x = np.maximum(x @ kernel + bias, 0)
+        return softmax(x @ out_kernel + out_bias)
+
+    def predict(self, crops: np.ndarray, verbose: int = 0, chunk_size: Optional[int] = None) -> np.ndarray:
+        """
+        Predicts the emotion probabilities for a batch of face crops.
+
+        :param crops: An (N, 48, 48, 1) array of grayscale face crops (0-255, like the Keras model gets).
+        :param verbose: Ignored, accepted so this is a drop-in for ``Sequential.predict``.
+        :param chunk_size: Overrides the instance's chunk size.
+        :return: An (N, 7) float32 array of probabilities.
+        :rtype: np.ndarray
+        """
+        crops = np.asarray(crops, dtype=np.float32)
+        chunk_size = chunk_size or self.chunk_size
+        if len(crops) <= chunk_size:
+            return self._forward(crops)
+        return np.concatenate([self._forward(crops[i:i + chunk_size]) for i in range(0, len(crops), chunk_size)])
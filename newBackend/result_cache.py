@@ -0,0 +1,135 @@
+"""
+Per-player cache of emotion predictions, keyed by a perceptual hash of the crop.
+
+A player holding still with the same expression sends crops that differ only
+by sensor noise. dHash (the sign of the horizontal gradient on a 9x8
+thumbnail, 64 bits) maps those to the same or a nearby hash, so a crop within
+``max_distance`` bits of a recent one gets that one's probabilities back
+instead of a forward pass. Every player has their own small LRU; the counters
+are shared so hit rate and saved inference time can be exported.
+"""
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+def dhash(crop: np.ndarray, size: int = 8) -> int:
+    """
+    Computes the difference hash of a grayscale crop.
+
+    :param crop: A (48, 48) or (48, 48, 1) grayscale face crop.
+    :param size: Rows and bits per row, the hash has ``size * size`` bits.
+    :return: The hash as an int.
+    :rtype: int
+    """
+    thumb = cv2.resize(np.asarray(crop).reshape(crop.shape[0], crop.shape[1]), (size + 1, size),
+                       interpolation=cv2.INTER_AREA)
+    bits = thumb[:, 1:] > thumb[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class CacheStats:
+    """Hit / miss counters shared by every player's cache."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.inference_seconds = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @property
+    def saved_seconds(self) -> float:
+        """Inference time the hits would have cost, at the mean inference time per miss."""
+        return self.hits * self.inference_seconds / self.misses if self.misses else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hit_rate, 4),
+            'inference_seconds': round(self.inference_seconds, 3),
+            'saved_seconds': round(self.saved_seconds, 3),
+        }
+
+
+class PredictionCache:
+    """
+    LRU of recent (hash, probabilities) pairs of one player.
+
+    :param max_entries: Hashes kept, the least recently matched is dropped first.
+    :param max_distance: Largest Hamming distance between two hashes still treated as the same crop.
+    :param stats: Counters to add to, usually shared by every player.
+    """
+
+    def __init__(self, max_entries: int = 16, max_distance: int = 4, stats: Optional[CacheStats] = None):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.stats = stats or CacheStats()
+        self._entries: OrderedDict[int, np.ndarray] = OrderedDict()
+
+    def get(self, key: int) -> Optional[np.ndarray]:
+        """
+        Looks a crop's hash up, exact match first, then the closest one within ``max_distance``.
+
+        :return: The cached probabilities, or None on a miss.
+        """
+        match = key if key in self._entries else None
+        if match is None and self.max_distance > 0:
+            best = self.max_distance + 1
+            for cached in self._entries:
+                distance = (cached ^ key).bit_count()
+                if distance < best:
+                    match, best = cached, distance
+
+        if match is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        self._entries.move_to_end(match)
+        return self._entries[match]
+
+    def put(self, key: int, probabilities: np.ndarray) -> None:
+        self._entries[key] = np.array(probabilities, copy=True)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+async def predict_with_cache(cache: Optional[PredictionCache], crops: list[np.ndarray], predict,
+                             items: Optional[list] = None) -> list:
+    """
+    Predicts crops, running only the ones the cache has no close match for.
+
+    :param cache: The player's cache, None predicts everything.
+    :param crops: The (48, 48, 1) face crops, they are hashed.
+    :param predict: Coroutine function taking a list of items and returning one result per item,
+        e.g. InferenceBatcher.submit_many.
+    :param items: What ``predict`` gets per crop (e.g. frame ring references), defaults to the crops.
+    :return: One probability vector per crop.
+    :rtype: list
+    """
+    items = crops if items is None else items
+    if cache is None:
+        return await predict(items)
+
+    keys = [dhash(crop) for crop in crops]
+    results = [cache.get(key) for key in keys]
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        start = time.perf_counter()
+        predictions = await predict([items[i] for i in misses])
+        cache.stats.inference_seconds += time.perf_counter() - start
+        for i, prediction in zip(misses, predictions):
+            results[i] = prediction
+            cache.put(keys[i], prediction)
+    return results
@@ -4,6 +4,9 @@ import cv2
 import numpy as np
 from scipy.signal import find_peaks, savgol_filter
 
+# Run from the repository root, like the other newBackend tools: python -m newBackend.test
+from newBackend.face_detection import detect_faces_hinted
+
 # COLLECT LAST ~40 FRAMES
 
 # Initialize the webcam
@@ -99,8 +102,8 @@ def get_eigenFace_mse(frame: np.ndarray, history: list[tuple[float, tuple[Option
     # Convert the frame to grayscale for face detection
     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-    # Detect faces in the frame
-    faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+    # Detect faces in the frame, on a frame downscaled to a 240 px short side
+    faces = detect_faces_hinted(gray, face_cascade, scale_factor=1.1, min_neighbors=4, min_side=240)
 
     rmse_history = [rmse if (rmse:= i[1][0]) is not None else 0 for i in history]
     projection_history = [i[1][1] for i in history]
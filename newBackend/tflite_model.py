@@ -0,0 +1,77 @@
+"""
+Runs the int8 TFLite export of the emotion model (see model_export.py).
+
+The interpreter comes from the small ``tflite-runtime`` / ``ai-edge-litert``
+wheels when one is installed, and from TensorFlow otherwise. TFLiteEmotionModel
+has the same ``predict`` call as the Keras model, so it can stand in for it.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TFLITE_MODEL_PATH = os.environ.get('KRACKLE_TFLITE_MODEL', os.path.join(BASE_DIR, 'model_int8.tflite'))
+
+
+def _interpreter_class():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteEmotionModel:
+    """
+    The emotion model as a TFLite interpreter.
+
+    :param model_path: The .tflite file written by ``python -m newBackend.model_export export``.
+    :param num_threads: Interpreter threads, None lets TFLite pick.
+    """
+
+    def __init__(self, model_path: str = TFLITE_MODEL_PATH, num_threads: Optional[int] = None):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"TFLite model not found: {model_path}")
+        self.model_path = model_path
+        self._interpreter = _interpreter_class()(model_path=model_path, num_threads=num_threads)
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = 0
+
+    def _resize(self, batch_size: int) -> None:
+        # Reallocating is cheap next to a forward pass, but skip it while the batch size holds
+        if batch_size != self._batch_size:
+            self._interpreter.resize_tensor_input(self._input['index'], [batch_size, 48, 48, 1])
+            self._interpreter.allocate_tensors()
+            self._batch_size = batch_size
+
+    def predict(self, crops: np.ndarray, verbose: int = 0) -> np.ndarray:
+        """
+        Predicts the emotion probabilities for a batch of face crops.
+
+        :param crops: An (N, 48, 48, 1) array of grayscale face crops (0-255, like the Keras model gets).
+        :param verbose: Ignored, accepted so this is a drop-in for ``Sequential.predict``.
+        :return: An (N, 7) float32 array of probabilities.
+        :rtype: np.ndarray
+        """
+        crops = np.asarray(crops, dtype=np.float32)
+        self._resize(len(crops))
+
+        # A fully integer model takes int8 input, quantise with the input's scale and zero point
+        scale, zero_point = self._input['quantization']
+        if self._input['dtype'] != np.float32 and scale:
+            info = np.iinfo(self._input['dtype'])
+            crops = np.clip(np.round(crops / scale + zero_point), info.min, info.max)
+        self._interpreter.set_tensor(self._input['index'], crops.astype(self._input['dtype']))
+        self._interpreter.invoke()
+
+        probs = self._interpreter.get_tensor(self._output['index'])
+        scale, zero_point = self._output['quantization']
+        if self._output['dtype'] != np.float32 and scale:
+            probs = (probs.astype(np.float32) - zero_point) * scale
+        return probs.astype(np.float32, copy=False)
@@ -0,0 +1,413 @@
+"""
+Pre-fork server for app.py.
+
+``uvicorn --workers N`` spawns fresh interpreters, so every worker imports
+app.py and loads the emotion model again. Here the master process imports
+app.py, loads the model weights and the face detector once, freezes the heap
+(``gc.freeze``, so the collector never writes to those objects), binds the
+socket and then forks the workers. Pages nobody writes to stay shared between
+all workers, copy-on-write, so an added worker costs its private memory only.
+
+Usage (the Procfile runs it with one worker):
+
+    python serve.py --workers 4 --port 8000
+
+Only the ``numpy`` backend is preloaded: TensorFlow and the TFLite interpreter
+start threads that don't survive a fork, so with ``keras`` / ``tflite`` the
+workers load the model themselves after the fork. ``--no-preload`` does the
+same for every backend, to measure the difference.
+
+Memory: send the master SIGUSR1, or pass ``--memory-report N``, to print the
+RSS and PSS of every worker from /proc/<pid>/smaps_rollup. RSS counts every
+shared page in full, PSS splits shared pages between the processes mapping
+them, so the sum of PSS is what the workers really cost together.
+
+With several workers the workers themselves are the inference parallelism, so
+KRACKLE_INFERENCE_WORKERS defaults to 0 (inference in the worker). Set
+explicitly, every worker starts its own process pool and shared-memory frame
+ring after the fork, in its startup hook, and only that worker unlinks the
+ring, so workers never share one. That makes workers x KRACKLE_INFERENCE_WORKERS
+inference processes.
+
+Every worker keeps its own lobbies (and Socket.IO sessions), so with more than
+one worker the players of a game must reach the same worker. Several workers
+therefore always run lobby-sharded:
+
+    python serve.py --workers 4
+
+A router process accepts every connection, peeks at its HTTP request line and
+hands the socket itself (SCM_RIGHTS over a unix socket) to the worker owning
+the ``lobbyCode`` query parameter, see newBackend/lobby_shards.py. The router
+never touches the traffic after that, and each lobby lives in exactly one
+worker, so nothing is locked across processes. Clients joining a lobby connect
+with ``?lobbyCode=<code>``; connections without one (e.g. to create a game)
+are spread by client address, and a worker creates only lobbies it owns.
+joinLobby on the wrong worker answers with a ``reconnect`` hint.
+"""
+import argparse
+import asyncio
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+SMAPS_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def read_memory(pid: int) -> Optional[dict[str, int]]:
+    """
+    Reads the memory totals of a process, in kB.
+
+    :param pid: The process id.
+    :return: The SMAPS_FIELDS values, or None if the process is gone (or not on Linux).
+    :rtype: Optional[dict[str, int]]
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+
+    memory = {}
+    for line in lines:
+        key, _, value = line.partition(':')
+        if key in SMAPS_FIELDS:
+            memory[key] = int(value.split()[0])
+    return memory
+
+
+def memory_report(pids: dict[int, str]) -> str:
+    """Formats RSS / PSS / private memory of every process, with the totals."""
+    lines = [f"{'process':>10} {'pid':>8} {'RSS MB':>8} {'PSS MB':>8} {'private MB':>10} {'shared MB':>9}"]
+    total_rss = total_pss = 0
+    for pid, name in pids.items():
+        memory = read_memory(pid)
+        if memory is None:
+            continue
+        private = memory.get('Private_Clean', 0) + memory.get('Private_Dirty', 0)
+        shared = memory.get('Shared_Clean', 0) + memory.get('Shared_Dirty', 0)
+        total_rss += memory['Rss']
+        total_pss += memory['Pss']
+        lines.append(f"{name:>10} {pid:>8} {memory['Rss'] / 1024:8.1f} {memory['Pss'] / 1024:8.1f}"
+                     f" {private / 1024:10.1f} {shared / 1024:9.1f}")
+    lines.append(f"{'total':>10} {'':>8} {total_rss / 1024:8.1f} {total_pss / 1024:8.1f}")
+    return '\n'.join(lines)
+
+
+def preload(preload_model: bool):
+    """Imports app.py and loads what the workers can share."""
+    import app
+
+    if preload_model and app.emotion_backend == 'numpy':
+        from newBackend.model_registry import get_model, report
+
+        get_model(app.emotion_backend)
+        print(f"[serve] Preloaded the {app.emotion_backend} model ({report()})")
+    elif preload_model:
+        print(f"[serve] The {app.emotion_backend} backend is not fork-safe, workers load it after the fork")
+    return app
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(asgi_app, sock: socket.socket, args: argparse.Namespace) -> None:
+    import uvicorn
+
+    # Drop the master's handlers, uvicorn installs its own for a graceful shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    config = uvicorn.Config(asgi_app, log_level=args.log_level, timeout_graceful_shutdown=args.graceful_timeout)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def routing_key(head: bytes, peer: str) -> tuple[Optional[str], str]:
+    """
+    Finds what a connection is routed by in the start of its HTTP request.
+
+    :param head: The first bytes of the request (request line and headers, as far as they arrived).
+    :param peer: The client's address, used when there is no lobby code.
+    :return: The lobby code (None without one), and the client address (X-Forwarded-For behind a proxy).
+    :rtype: tuple[Optional[str], str]
+    """
+    lines = head.decode('latin-1').split('\r\n')
+    parts = lines[0].split(' ')
+    lobby_code = None
+    if len(parts) >= 2:
+        lobby_code = parse_qs(urlsplit(parts[1]).query).get('lobbyCode', [None])[0]
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'x-forwarded-for' and value.strip():
+            peer = value.split(',')[0].strip()
+            break
+    return lobby_code, peer
+
+
+async def wait_readable(sock: socket.socket) -> None:
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    loop.add_reader(sock.fileno(), future.set_result, None)
+    try:
+        await future
+    finally:
+        loop.remove_reader(sock.fileno())
+
+
+async def peek_head(conn: socket.socket, timeout: float = 5.0) -> bytes:
+    """Waits for the request line of a connection and returns what arrived, without consuming it."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        await asyncio.wait_for(wait_readable(conn), deadline - time.monotonic())
+        head = conn.recv(4096, socket.MSG_PEEK)
+        if not head or b'\r\n\r\n' in head or len(head) == 4096:
+            return head
+        # Part of the request arrived, the peek would see the same bytes until more do
+        await asyncio.sleep(0.005)
+    return b''
+
+
+class ShardRouter:
+    """
+    Hands accepted connections to the worker owning their lobby.
+
+    :param run_dir: Directory of the workers' unix sockets (``worker-<index>.sock``).
+    :param workers: The number of workers.
+    """
+
+    def __init__(self, run_dir: str, workers: int):
+        from newBackend.lobby_shards import lobby_shard
+
+        self.lobby_shard = lobby_shard
+        self.run_dir = run_dir
+        self.workers = workers
+        self._channels: dict[int, socket.socket] = {}
+
+    def channel(self, index: int) -> socket.socket:
+        if index not in self._channels:
+            channel = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            channel.connect(os.path.join(self.run_dir, f'worker-{index}.sock'))
+            self._channels[index] = channel
+        return self._channels[index]
+
+    async def hand_off(self, conn: socket.socket, index: int, timeout: float = 10.0) -> bool:
+        # A worker that is still starting (or restarting) has no socket yet, and a restarted one has
+        # a new socket: a failed send reconnects, with a growing delay, until the worker is there
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delay = 0.02
+        while True:
+            try:
+                socket.send_fds(self.channel(index), [b'c'], [conn.fileno()])
+                return True
+            except OSError:
+                channel = self._channels.pop(index, None)
+                if channel is not None:
+                    channel.close()
+            if loop.time() + delay > deadline:
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def route(self, conn: socket.socket) -> None:
+        try:
+            head = await peek_head(conn)
+            if head:
+                lobby_code, peer = routing_key(head, conn.getpeername()[0])
+                index = self.lobby_shard(lobby_code or peer, self.workers)
+                if not await self.hand_off(conn, index):
+                    print(f"[serve] worker {index} is not accepting connections", file=sys.stderr)
+        except (OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            # The worker has its own copy of the socket
+            conn.close()
+
+    async def serve(self, sock: socket.socket) -> None:
+        loop = asyncio.get_running_loop()
+        sock.setblocking(False)
+        while True:
+            conn, _ = await loop.sock_accept(sock)
+            loop.create_task(self.route(conn))
+
+
+def run_router(sock: socket.socket, run_dir: str, args: argparse.Namespace) -> None:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    asyncio.run(ShardRouter(run_dir, args.workers).serve(sock))
+
+
+def run_shard_worker(app, run_dir: str, index: int, args: argparse.Namespace) -> None:
+    """Runs one lobby-sharded worker, it gets its connections from the router instead of a listening socket."""
+    import uvicorn
+
+    class ShardServer(uvicorn.Server):
+        async def startup(self, sockets=None) -> None:
+            await super().startup(sockets=[])
+            if not self.should_exit:
+                asyncio.get_running_loop().create_task(self.receive_connections())
+
+        def create_protocol(self) -> asyncio.Protocol:
+            # Same as the protocol factory uvicorn builds for its own listening sockets
+            return self.config.http_protocol_class(config=self.config, server_state=self.server_state,
+                                                   app_state=self.lifespan.state)
+
+        async def receive_connections(self) -> None:
+            loop = asyncio.get_running_loop()
+            path = os.path.join(run_dir, f'worker-{index}.sock')
+            if os.path.exists(path):
+                os.unlink(path)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(path)
+            listener.listen(8)
+            listener.setblocking(False)
+            while True:
+                channel, _ = await loop.sock_accept(listener)
+                loop.create_task(self.receive_sockets(channel))
+
+        async def receive_sockets(self, channel: socket.socket) -> None:
+            loop = asyncio.get_running_loop()
+            while True:
+                await wait_readable(channel)
+                try:
+                    message, fds, _, _ = socket.recv_fds(channel, 64, 64)
+                except BlockingIOError:
+                    continue
+                if not message:
+                    channel.close()
+                    return
+                for fd in fds:
+                    conn = socket.socket(fileno=fd)
+                    conn.setblocking(False)
+                    await loop.connect_accepted_socket(self.create_protocol, conn)
+
+    app.shard_index, app.shard_count = index, args.workers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    config = uvicorn.Config(app.app, log_level=args.log_level, timeout_graceful_shutdown=args.graceful_timeout)
+    ShardServer(config).run()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Pre-fork server for app.py")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=int(os.environ.get('PORT', 8000)))
+    ap.add_argument("--workers", type=int, default=int(os.environ.get('KRACKLE_WEB_WORKERS', 1)))
+    ap.add_argument("--no-preload", action="store_true", help="let every worker load the model itself")
+    ap.add_argument("--memory-report", type=float, default=0, help="print worker memory every N seconds")
+    ap.add_argument("--log-level", default="info")
+    ap.add_argument("--graceful-timeout", type=int, default=10)
+    args = ap.parse_args()
+    # Workers sharing the listening socket would each get a random part of every lobby's players,
+    # so with more than one the router sends every lobby's connections to the worker owning it
+    sharded = args.workers > 1
+
+    if args.workers > 1:
+        # The forked workers are the parallelism already. Set explicitly, every worker creates its
+        # own inference pool and frame ring after the fork (app.start_inference)
+        inference_workers = int(os.environ.setdefault('KRACKLE_INFERENCE_WORKERS', '0'))
+        if inference_workers > 0:
+            total = args.workers * inference_workers
+            print(f"[serve] Every worker starts its own pool of {inference_workers} inference processes, {total} in all"
+                  + (f", more than the {os.cpu_count()} CPUs" if total > (os.cpu_count() or 1) else ""))
+
+    start = time.perf_counter()
+    app = preload(not args.no_preload)
+    sock = bind(args.host, args.port)
+    print(f"[serve] Master ready in {time.perf_counter() - start:.2f} s, forking {args.workers} workers"
+          + (" and the lobby router" if sharded else ""))
+
+    # Objects that exist now are never collected, so the collector doesn't dirty their pages in the workers
+    gc.collect()
+    gc.freeze()
+
+    workers: dict[int, str] = {}
+    stopping = False
+    # Unix sockets the router hands connections to the workers through
+    run_dir = tempfile.mkdtemp(prefix='krackle-') if sharded else None
+
+    def fork_worker(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                if sharded:
+                    sock.close()
+                    run_shard_worker(app, run_dir, index, args)
+                else:
+                    run_worker(app.app, sock, args)
+            finally:
+                os._exit(0)
+        workers[pid] = f'worker {index}'
+
+    def fork_router() -> None:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_router(sock, run_dir, args)
+            finally:
+                os._exit(0)
+        workers[pid] = 'router'
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def print_report(signum=None, frame=None) -> None:
+        print(memory_report({os.getpid(): 'master', **workers}), flush=True)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, print_report)
+
+    for index in range(args.workers):
+        fork_worker(index)
+    if sharded:
+        fork_router()
+
+    next_report = time.monotonic() + args.memory_report
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            name = workers.pop(pid)
+            if not stopping:
+                # A worker died, replace it (it still gets the preloaded model)
+                print(f"[serve] {name} (pid {pid}) exited with status {status}, restarting", file=sys.stderr)
+                if name == 'router':
+                    fork_router()
+                else:
+                    fork_worker(int(name.split()[-1]))
+            continue
+
+        if args.memory_report and time.monotonic() >= next_report:
+            print_report()
+            next_report = time.monotonic() + args.memory_report
+        time.sleep(0.5)
+
+    if run_dir:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import json
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from urllib.parse import parse_qs
 from .views.share_data import lobbies_data  # Corrected import path
@@ -6,7 +7,9 @@ from .utils.image_utils import save_player_image, delete_lobby_images, get_image
 import numpy as np
 import sys
 import os
-from .emotion import predict_emotion
+from .emotion import (create_client_verifier, create_frame_slot, create_laugh_scorer, create_prediction_cache,
+                      laugh_scorers, load_controller, pick_keyframe, predict_probabilities_batched)
+from newBackend.client_expressions import decode_crop, expression_vector, laugh_score
 from .shorts_links import urls
 from django.conf import settings
 import cv2
@@ -111,8 +114,16 @@ class LobbyConsumer(AsyncWebsocketConsumer):
             }
 
             self.video_ind = 0
+            self.prediction_cache = create_prediction_cache()
+            self.client_verifier = create_client_verifier()
+            # Uploads are processed one at a time, newest first, see queue_upload
+            self.frame_slot = create_frame_slot(self.process_upload)
+            # Face crops sent with face_detection_data likewise, see handle_face_detection_data
+            self.crop_slot = create_frame_slot(self.process_crop)
+            self.capture_control = None
 
             await self.broadcast_lobby_update("user_connected")
+            await self.send_capture_control()
 
         except Exception as e:
             print(f"[LobbyConsumer] EXCEPTION in connect: {e}")
@@ -123,6 +134,10 @@ class LobbyConsumer(AsyncWebsocketConsumer):
             raise  # Optionally re-raise if you want it to appear in server logs as an error
 
     async def disconnect(self, close_code):
+        if hasattr(self, 'frame_slot'):
+            self.frame_slot.close()
+            self.crop_slot.close()
+            load_controller.remove_player(self.channel_name)
         if hasattr(self, 'lobby_code') and self.lobby_code and hasattr(self, 'user_token') and self.user_token:
             lobby_info = lobbies_data.get(self.lobby_code)
             if lobby_info and 'connected_users' in lobby_info:
@@ -135,7 +150,12 @@ class LobbyConsumer(AsyncWebsocketConsumer):
             if hasattr(self, 'lobby_group_name'):
                 await self.channel_layer.group_discard(self.lobby_group_name, self.channel_name)
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
+        # Binary frames carry the raw JPEG bytes of an image upload (a burst has its JPEGs back to back)
+        if bytes_data is not None:
+            self.queue_upload({'image_data': bytes_data})
+            return
+
         text_data_json = json.loads(text_data)
         message_type = text_data_json.get('type')
         payload = text_data_json.get('payload', {})
@@ -150,7 +170,7 @@ class LobbyConsumer(AsyncWebsocketConsumer):
 
         # Image upload for verification
         elif message_type == 'upload_image':
-            await self.handle_upload_image(payload)
+            self.queue_upload(payload)
 
         # Face detection data for verification
         elif message_type == 'face_detection_data':
@@ -286,6 +306,7 @@ class LobbyConsumer(AsyncWebsocketConsumer):
 
         # init laugh_meters
         lobby_info['laugh_meters'] = {player: 0.0 for player in players}
+        laugh_scorers[self.lobby_code] = create_laugh_scorer(players)
 
         unverified_players = [player for player in players if player not in verified_players]
 
@@ -350,6 +371,7 @@ class LobbyConsumer(AsyncWebsocketConsumer):
 
         # Remove the lobby from data
         del lobbies_data[self.lobby_code]
+        laugh_scorers.pop(self.lobby_code, None)
 
         # Close all connections (they'll handle cleanup in disconnect)
         await self.channel_layer.group_send(
@@ -457,9 +479,48 @@ class LobbyConsumer(AsyncWebsocketConsumer):
         else:
             await self.send_private_message("error", "No valid settings to change.")
 
+    def queue_upload(self, payload):
+        """
+        Hands an upload to the connection's frame slot and returns right away.
+
+        Channels runs receive() for one message after the other, so awaiting the
+        upload here would queue every later frame behind it. In the slot a newer
+        upload replaces one still waiting, and uploads with a ``captured_at`` time
+        (ms since the epoch) that arrive too late are skipped.
+        """
+        if not hasattr(self, 'frame_slot'):
+            return
+        # The arrival time goes along, so the load controller sees the time uploads wait for their turn
+        self.frame_slot.offer((payload, time.perf_counter()), payload.get('captured_at'))
+
+    async def process_upload(self, upload):
+        """Handles an upload from the frame slot, timing it from its arrival for the load controller."""
+        payload, arrived = upload
+        await self.handle_upload_image(payload)
+        load_controller.record(time.perf_counter() - arrived, self.channel_name)
+        await self.send_capture_control()
+
+    async def send_capture_control(self):
+        """
+        Sends the recommended upload interval and frame size when they changed.
+
+        The interval follows the server's load and this connection's own frame latency (see
+        newBackend/load_control.py), but is never shorter than the lobby's face detection frequency when the admin enabled it.
+        """
+        face_settings = lobbies_data.get(self.lobby_code, {}).get('face_detection_settings', {})
+        min_interval = face_settings.get('detection_frequency') if face_settings.get('enabled') else None
+        control = load_controller.control(self.channel_name, min_interval)
+        if control != self.capture_control:
+            self.capture_control = control
+            await self.send(text_data=json.dumps({'type': 'capture_control', **control}))
+
     async def handle_upload_image(self, payload):
         """Handle player image upload for verification"""
-        image_data = payload.get('image_data')
+        try:
+            # A burst of frames keeps its sharpest one
+            image_data = pick_keyframe(payload)
+        except ValueError:
+            image_data = None
 
         if not image_data:
             await self.send_private_message("error", "No image data provided.")
@@ -499,6 +560,92 @@ class LobbyConsumer(AsyncWebsocketConsumer):
                 'verified_usernames': lobby_info['verified_players']
             })
 
+    async def handle_face_detection_data(self, payload):
+        """
+        Handle face detection results computed in the browser (face-api)
+
+        ``face_data.expressions`` (face-api's expression probabilities) goes into the
+        laugh meter as is, without server inference. A sampled share of the frames is
+        checked: the player is sent a ``crop_request`` and their next frame carries
+        ``face_data.crop`` (a 48x48 grayscale face crop, raw bytes or an image, base64),
+        on which the server model must reach the same laugh decision. A player who fails
+        too many checks gets a ``crop_request`` with ``always`` set and only counts with
+        their crops from then on, see newBackend/client_expressions.py. A crop without
+        expressions is always predicted, there is no client result to check.
+
+        Crops go through the connection's crop slot like uploads do (see queue_upload),
+        so the model never runs while receive() waits on it.
+        """
+        lobby_info = lobbies_data.get(self.lobby_code)
+        if not lobby_info:
+            await self.send_private_message("error", "Lobby not found.")
+            return
+
+        # Detection results only matter while a round is played
+        if lobby_info.get('game_state', {}).get('status') != 'playing':
+            return
+
+        face_data = payload.get('face_data') or {}
+        if not face_data.get('faces_detected'):
+            return
+
+        try:
+            expressions = face_data.get('expressions')
+            expressions = expression_vector(expressions) if expressions is not None else None
+            crop = face_data.get('crop')
+            crop = decode_crop(crop) if crop is not None else None
+        except (TypeError, ValueError) as e:
+            await self.send_private_message("error", f"Invalid face detection data: {e}")
+            return
+
+        if expressions is None and crop is None:
+            await self.send_private_message("error", "Face detection data needs expressions or a face crop.")
+            return
+
+        verifier = self.client_verifier
+        if expressions is not None and verifier.wants_check():
+            if crop is not None:
+                verifier.answered()
+            elif verifier.asked is None:
+                verifier.ask()
+                await self.send(text_data=json.dumps({'type': 'crop_request', 'always': False}))
+            elif verifier.missed(expressions) and not verifier.trusted:
+                await self.send_distrusted()
+                return
+
+        if expressions is not None and not verifier.trusted and crop is None:
+            await self.send_private_message("error", "Expressions are no longer accepted alone, send face crops.")
+            return
+
+        # The server's prediction counts for crops alone and for players no longer trusted
+        use_server = expressions is None or not verifier.trusted
+        if crop is not None:
+            self.crop_slot.offer((crop, expressions, use_server), face_data.get('timestamp'))
+        if not use_server:
+            await self.update_laugh_meter(expressions)
+
+    async def process_crop(self, item):
+        """Predicts a face crop from the crop slot, for the laugh meter or to spot check the expressions sent with it."""
+        crop, expressions, use_server = item
+        try:
+            probabilities = await predict_probabilities_batched(crop, self.prediction_cache)
+        except Exception as e:
+            await self.send_private_message("error", f"Emotion prediction failed: {e}")
+            return
+
+        if expressions is not None:
+            trusted = self.client_verifier.trusted
+            self.client_verifier.record(expressions, probabilities)
+            if trusted and not self.client_verifier.trusted:
+                await self.send_distrusted()
+        if use_server:
+            await self.update_laugh_meter(probabilities)
+
+    async def send_distrusted(self):
+        """Tells a player who failed too many spot checks to send a face crop with every frame."""
+        await self.send_private_message("error", "Expressions are no longer accepted alone, send face crops.")
+        await self.send(text_data=json.dumps({'type': 'crop_request', 'always': True}))
+
     async def handle_face_detection_admin_settings(self, payload):
         """Handle admin face detection settings"""
         lobby_info = lobbies_data.get(self.lobby_code)
@@ -597,16 +744,24 @@ class LobbyConsumer(AsyncWebsocketConsumer):
 
         try:
 
-            result = predict_emotion(face_array)
-            lobbies_data[self.lobby_code]['laugh_meters'][self.username] += 0.05 if result in ['Happy', 'Surprised'] else -0.01
-            if (meter := lobbies_data[self.lobby_code]['laugh_meters'][self.username]) < 0.0:
-                lobbies_data[self.lobby_code]['laugh_meters'][self.username] = 0.0
-
-            await self.send_private_message("emotion_prediction_update", json.dumps(lobbies_data[self.lobby_code]['laugh_meters']))
+            probabilities = await predict_probabilities_batched(face_array[0], self.prediction_cache)
+            await self.update_laugh_meter(probabilities)
         except Exception as e:
             await self.send_private_message("error", f"Emotion prediction failed: {e}")
             return None
 
+    async def update_laugh_meter(self, probabilities):
+        """Adds one prediction to the player's laugh window and sends the lobby's meters back"""
+        scorer = laugh_scorers.get(self.lobby_code)
+        if scorer is None:
+            return
+        scorer.update(self.username, laugh_score(probabilities))
+
+        laugh_meters = lobbies_data[self.lobby_code]['laugh_meters']
+        laugh_meters.update(scorer.meters())
+
+        await self.send_private_message("emotion_prediction_update", json.dumps(laugh_meters))
+
     async def handle_new_game_video(self, payload):
         """Handle new game video upload
 
@@ -1,31 +1,32 @@
 import numpy as np
 
 import cv2
-from keras_core.models import Sequential
-from keras_core.layers import Dense, Dropout, Flatten
-from keras_core.layers import Conv2D, MaxPooling2D
+from django.conf import settings
 
+from newBackend.batching import InferenceBatcher
+from newBackend.client_expressions import ClientVerifier, SpotCheckStats
+from newBackend.frame_slot import LatestFrameSlot, SlotStats
+from newBackend.keyframe import SCORE_SIDE, KeyframeStats, frame_bytes, select_keyframe, split_jpegs
+from newBackend.laugh_scoring import LaughScorer
+from newBackend.load_control import LoadController
+from newBackend.model_registry import get_model, warm_up
+from newBackend.result_cache import CacheStats, PredictionCache, predict_with_cache
 
-model = Sequential()
 
-# Add layers
-model.add(Conv2D(32, kernel_size=(3, 3), activation='relu', input_shape=(48, 48, 1)))
-model.add(Conv2D(64, kernel_size=(3, 3), activation='relu'))
-model.add(MaxPooling2D(pool_size=(2, 2)))
-model.add(Dropout(0.25))
+def _model_path():
+    # The tflite backend reads its own file (KRACKLE_TFLITE_MODEL)
+    return None if settings.EMOTION_BACKEND == 'tflite' else settings.EMOTION_MODEL_PATH
 
-model.add(Conv2D(128, kernel_size=(3, 3), activation='relu'))
-model.add(MaxPooling2D(pool_size=(2, 2)))
-model.add(Conv2D(128, kernel_size=(3, 3), activation='relu'))
-model.add(MaxPooling2D(pool_size=(2, 2)))
-model.add(Dropout(0.25))
 
-model.add(Flatten())
-model.add(Dense(1024, activation='relu'))
-model.add(Dropout(0.5))
-model.add(Dense(7, activation='softmax'))
+def get_emotion_model():
+    """The emotion model of this process, loaded on first use (see newBackend/model_registry.py)."""
+    return get_model(settings.EMOTION_BACKEND, _model_path())
+
+
+def warm_up_emotion_model() -> None:
+    """Loads the model and runs one forward pass, called from asgi.py when the server starts."""
+    warm_up(settings.EMOTION_BACKEND, _model_path())
 
-model.load_weights('api/model.h5')
 
 emotion_dict: dict[int, str] = {0: "Angry", 1: "Disgusted", 2: "Fearful", 3: "Happy", 4: "Neutral", 5: "Sad", 6: "Surprised"}
 
@@ -38,9 +39,123 @@ def predict_emotion(frame: np.ndarray) -> str:
     :return: A list of predictions for each detected face in the frame.
     :rtype: list
     """
-    prediction = model.predict(frame, verbose=0)
+    prediction = get_emotion_model().predict(frame, verbose=0)
     print("[AI] Prediction: ", prediction)
     index = np.argmax(prediction[0])
     emotion = emotion_dict[index]
     print("[AI] Emotion: ", emotion, "Confident: ", prediction[0][index])
     return emotion
+
+
+def predict_batch(faces: list[np.ndarray]) -> np.ndarray:
+    """
+    Runs one forward pass over a batch of (48, 48, 1) face crops.
+
+    :param faces: The face crops queued by every connection.
+    :type faces: list[np.ndarray]
+    :return: An (N, 7) array of probabilities, one row per face.
+    :rtype: np.ndarray
+    """
+    return get_emotion_model().predict(np.stack(faces), verbose=0)
+
+
+inference_batcher = InferenceBatcher(
+    predict_batch,
+    max_batch_size=settings.EMOTION_BATCH_SIZE,
+    max_wait=settings.EMOTION_BATCH_WAIT_MS / 1000,
+)
+
+
+# Hit / miss counters of every player's prediction cache, served by the stats view
+result_cache_stats = CacheStats()
+
+
+def create_prediction_cache():
+    """A player's prediction cache, or None when EMOTION_RESULT_CACHE_SIZE is 0."""
+    if settings.EMOTION_RESULT_CACHE_SIZE <= 0:
+        return None
+    return PredictionCache(settings.EMOTION_RESULT_CACHE_SIZE, settings.EMOTION_RESULT_CACHE_DISTANCE,
+                           result_cache_stats)
+
+
+frame_slot_stats = SlotStats()
+
+
+def create_frame_slot(process) -> LatestFrameSlot:
+    """A connection's latest-frame-wins slot for uploads or face crops, ``process`` is awaited with each item that gets its turn."""
+    deadline = settings.EMOTION_FRAME_DEADLINE_MS
+    return LatestFrameSlot(process, max_age=deadline / 1000 if deadline > 0 else None, stats=frame_slot_stats)
+
+
+# Counters of the expression vectors clients send with face_detection_data, and their spot checks
+spot_check_stats = SpotCheckStats()
+
+
+def create_client_verifier() -> ClientVerifier:
+    """A player's spot checker for the expression vectors their browser sends."""
+    return ClientVerifier(threshold=settings.EMOTION_LAUGH_THRESHOLD, check_rate=settings.EMOTION_SPOT_CHECK_RATE,
+                          margin=settings.EMOTION_SPOT_CHECK_MARGIN, stats=spot_check_stats)
+
+
+keyframe_stats = KeyframeStats()
+
+
+def pick_keyframe(payload: dict):
+    """
+    The image of an upload, the sharpest one if it is a burst.
+
+    :param payload: The upload: ``image_data`` holds one image (base64, or bytes with one or
+        more JPEGs back to back), or ``frames`` a list of them.
+    :return: The chosen image, as sent (base64 or bytes), None when there is none.
+    """
+    frames = payload.get('frames')
+    image_data = payload.get('image_data')
+    if not frames and isinstance(image_data, (bytes, bytearray)):
+        frames = split_jpegs(image_data)
+    if not frames:
+        return image_data
+    if len(frames) == 1:
+        return frames[0]
+
+    # Only the index is needed, the frames are decoded no larger than scoring needs
+    index, _, _ = select_keyframe([frame_bytes(frame) for frame in frames], min_side=SCORE_SIDE,
+                                  stats=keyframe_stats)
+    return frames[index]
+
+
+# Laugh windows of the lobbies being played, by lobby code (kept out of lobbies_data, which holds plain data)
+laugh_scorers: dict[str, LaughScorer] = {}
+
+
+def create_laugh_scorer(players) -> LaughScorer:
+    """A new round's laugh scorer, with an empty window for each of the players."""
+    scorer = LaughScorer(window=settings.EMOTION_LAUGH_WINDOW_S, threshold=settings.EMOTION_LAUGH_THRESHOLD,
+                         ratio=settings.EMOTION_LAUGH_RATIO)
+    for player in players:
+        scorer.add_player(player)
+    return scorer
+
+
+# Recommended upload interval of every connection of this process, sent as 'capture_control' messages
+load_controller = LoadController(
+    lambda: inference_batcher.pending,
+    base_interval=settings.EMOTION_CAPTURE_INTERVAL_MS / 1000,
+    max_interval=settings.EMOTION_CAPTURE_MAX_INTERVAL_MS / 1000,
+    target_latency=settings.EMOTION_TARGET_LATENCY_MS / 1000,
+    max_queue=settings.EMOTION_MAX_QUEUE,
+)
+
+
+async def predict_probabilities_batched(crop: np.ndarray, cache=None) -> np.ndarray:
+    """
+    Predicts the emotion probabilities of one face, batched with those of the other players.
+
+    :param crop: A (48, 48, 1) face crop.
+    :type crop: np.ndarray
+    :param cache: The player's PredictionCache, a close enough earlier crop skips the model.
+    :type cache: PredictionCache
+    :return: The (7,) probabilities, in the order of emotion_dict.
+    :rtype: np.ndarray
+    """
+    prediction, = await predict_with_cache(cache, [crop], inference_batcher.submit_many)
+    return prediction
@@ -6,4 +6,5 @@ urlpatterns = [
     path('join/create_lobby/', create_lobby), # New route for creating lobbies
     path('join/', join_lobby),
     path('play/', get_lobby_players),
+    path('stats/', inference_stats),
 ]
\ No newline at end of file
@@ -11,6 +11,8 @@ from django.conf import settings
 import numpy as np
 import cv2
 
+from newBackend.frame_decode import decode_gray
+
 def create_lobby_image_directory(lobby_code):
     """Create a directory for storing lobby images"""
     lobby_dir = Path(settings.MEDIA_ROOT) / 'lobby_images' / lobby_code
@@ -20,19 +22,22 @@ def create_lobby_image_directory(lobby_code):
 
 def save_player_image(lobby_code, username, base64_image_data):
     """
-    Save a player's image from base64 data
+    Save a player's image from base64 data (or raw image bytes from a binary frame)
     Returns the filename of the saved image
     """
     try:
         # Create lobby directory
         lobby_dir = create_lobby_image_directory(lobby_code)
         
-        # Decode base64 image
-        if ',' in base64_image_data:
-            # Remove data URL prefix if present
-            base64_image_data = base64_image_data.split(',')[1]
-        
-        image_data = base64.b64decode(base64_image_data)
+        if isinstance(base64_image_data, (bytes, bytearray)):
+            image_data = base64_image_data
+        else:
+            # Decode base64 image
+            if ',' in base64_image_data:
+                # Remove data URL prefix if present
+                base64_image_data = base64_image_data.split(',')[1]
+
+            image_data = base64.b64decode(base64_image_data)
         
         # Open and process image
         image = Image.open(BytesIO(image_data))
@@ -79,11 +84,11 @@ def get_image_numpy(lobby_code, username) -> np.ndarray:
     """Get the image as a numpy array that is compatible with OpenCV and the AI"""
     # Build the file path, not the URL
     filepath = get_player_image_url(lobby_code, username)
-    face = cv2.imread(str(filepath))
-    if face is None:
+    if not filepath.exists():
         raise FileNotFoundError(f"Image file not found: {filepath}")
 
-    grey = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+    # Decoded straight to a reduced grayscale image, it only has to cover 48x48
+    grey, _ = decode_gray(filepath.read_bytes(), min_side=48)
     cropped_img = np.expand_dims(np.expand_dims(cv2.resize(grey, (48, 48)), -1), 0)
     return cropped_img
 
@@ -4,3 +4,5 @@ from .join_views import join_lobby, create_lobby
 
 from .play_views import get_lobby_players
 
+from .stats_views import inference_stats
+
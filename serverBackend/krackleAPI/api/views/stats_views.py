@@ -0,0 +1,22 @@
+from django.http import JsonResponse
+
+from ..emotion import (frame_slot_stats, inference_batcher, keyframe_stats, load_controller, result_cache_stats,
+                       spot_check_stats)
+
+
+def inference_stats(request):
+    """
+    Inference counters of this server process: load, dropped frames, bursts,
+    client expression spot checks, prediction cache hit rate and batch sizes.
+    """
+    return JsonResponse({
+        "load": load_controller.as_dict(),
+        "frame_slot": frame_slot_stats.as_dict(),
+        "keyframe": keyframe_stats.as_dict(),
+        "spot_check": spot_check_stats.as_dict(),
+        "result_cache": result_cache_stats.as_dict(),
+        "batcher": {
+            "batches": inference_batcher.batches_run,
+            "mean_batch_size": round(inference_batcher.mean_batch_size, 2),
+        },
+    })
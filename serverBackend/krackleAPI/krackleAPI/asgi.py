@@ -3,12 +3,22 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'krackleAPI.settings')
+# Set up Django before importing the consumers, they read settings at import time
+django_asgi_app = get_asgi_application()
+
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import api.routing  # absolute import
+from django.conf import settings
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'krackleAPI.settings')
-django_asgi_app = get_asgi_application()
+if settings.EMOTION_WARM_UP:
+    # The model is loaded lazily, warm it up in the background so the first player doesn't wait for it
+    import threading
+    from api.emotion import warm_up_emotion_model
+
+    threading.Thread(target=warm_up_emotion_model, name="emotion-warm-up", daemon=True).start()
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
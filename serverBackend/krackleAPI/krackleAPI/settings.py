@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv # Import load_dotenv
 
 
@@ -19,6 +20,11 @@ from dotenv import load_dotenv # Import load_dotenv
 BASE_DIR = Path(__file__).resolve().parent
 load_dotenv(BASE_DIR / '.env')
 
+# Repository root, for the inference helpers shared with app.py (newBackend)
+REPO_ROOT = BASE_DIR.parents[2]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.append(str(REPO_ROOT))
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', 'default_secret_key')  # Use environment variable for security
@@ -110,6 +116,45 @@ CHANNEL_LAYERS = {
 }
 
 
+# Emotion inference micro-batching: a batch runs once it holds
+# EMOTION_BATCH_SIZE face crops or EMOTION_BATCH_WAIT_MS has passed
+EMOTION_BATCH_SIZE = int(os.getenv('KRACKLE_BATCH_SIZE', 32))
+EMOTION_BATCH_WAIT_MS = float(os.getenv('KRACKLE_BATCH_WAIT_MS', 10))
+
+# Emotion model backend: keras runs api/model.h5, numpy runs it without TensorFlow,
+# tflite its int8 export (python -m newBackend.model_export, from the repository root)
+EMOTION_BACKEND = os.getenv('KRACKLE_EMOTION_BACKEND', 'keras')
+# Weights of the keras and numpy backends (tflite reads KRACKLE_TFLITE_MODEL)
+EMOTION_MODEL_PATH = os.getenv('KRACKLE_MODEL_PATH', str(BASE_DIR.parent / 'api' / 'model.h5'))
+# Per-player cache of predictions by perceptual hash of the face crop (0 entries turns it off),
+# crops whose 64-bit hashes differ in at most EMOTION_RESULT_CACHE_DISTANCE bits share a prediction
+EMOTION_RESULT_CACHE_SIZE = int(os.getenv('KRACKLE_RESULT_CACHE_SIZE', 16))
+EMOTION_RESULT_CACHE_DISTANCE = int(os.getenv('KRACKLE_RESULT_CACHE_DISTANCE', 4))
+# Image uploads keep only the newest frame waiting per connection. Uploads sent with a captured_at
+# time (ms since the epoch) that are this much later than usual are skipped, 0 keeps them all
+EMOTION_FRAME_DEADLINE_MS = float(os.getenv('KRACKLE_FRAME_DEADLINE_MS', 1000))
+# Upload interval recommended to clients: EMOTION_CAPTURE_INTERVAL_MS while uploads take less than
+# EMOTION_TARGET_LATENCY_MS and fewer than EMOTION_MAX_QUEUE crops wait for inference, growing up to
+# EMOTION_CAPTURE_MAX_INTERVAL_MS (with smaller frames) when the node can't keep up
+EMOTION_CAPTURE_INTERVAL_MS = float(os.getenv('KRACKLE_CAPTURE_INTERVAL_MS', 500))
+EMOTION_CAPTURE_MAX_INTERVAL_MS = float(os.getenv('KRACKLE_CAPTURE_MAX_INTERVAL_MS', 3000))
+EMOTION_TARGET_LATENCY_MS = float(os.getenv('KRACKLE_TARGET_LATENCY_MS', 250))
+EMOTION_MAX_QUEUE = int(os.getenv('KRACKLE_MAX_QUEUE', 64))
+# Share of the face_detection_data frames whose client expression vector is checked against the
+# server model, on the face crop the client is asked to send with its next frame. A check passes when
+# both lead to the same laugh decision, or when the server's Happy + Surprised is within EMOTION_SPOT_CHECK_MARGIN of EMOTION_LAUGH_THRESHOLD
+EMOTION_SPOT_CHECK_RATE = float(os.getenv('KRACKLE_SPOT_CHECK_RATE', 0.1))
+EMOTION_SPOT_CHECK_MARGIN = float(os.getenv('KRACKLE_SPOT_CHECK_MARGIN', 0.1))
+# A prediction laughs when Happy + Surprised is over EMOTION_LAUGH_THRESHOLD. A player's laugh meter is the
+# share of laughing predictions of the last EMOTION_LAUGH_WINDOW_S seconds over EMOTION_LAUGH_RATIO, so
+# past 1.0 they lost the round
+EMOTION_LAUGH_WINDOW_S = float(os.getenv('KRACKLE_LAUGH_WINDOW_S', 4.0))
+EMOTION_LAUGH_THRESHOLD = float(os.getenv('KRACKLE_LAUGH_THRESHOLD', 0.8))
+EMOTION_LAUGH_RATIO = float(os.getenv('KRACKLE_LAUGH_RATIO', 0.3))
+# Load the model in the background as soon as the ASGI app starts, instead of on the first prediction
+EMOTION_WARM_UP = os.getenv('KRACKLE_WARM_UP', '1') == '1'
+
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 